@@ -1,56 +1,450 @@
-import subprocess
-from tempfile import TemporaryDirectory
-from shutil import unpack_archive, move
+import argparse
+import csv
+import gzip
+import hashlib
+import json
+import posixpath
+import threading
+import urllib.error
+import urllib.request
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from shutil import copyfileobj
 from pathlib import Path
-import wget
+from typing import Optional
 import ssl
 
 ssl._create_default_https_context = ssl._create_unverified_context
 
 
 BTS_ROOT_URL = "https://transtats.bts.gov/PREZIP"
+CHECKSUM_CACHE = "checksums.json"
+UPLOAD_MANIFEST = "upload_manifest.json"
 
+# Files larger than this are uploaded as parallel parts that are composed into one object
+COMPOSITE_UPLOAD_PART_SIZE = 64 * 1024 * 1024
+COMPOSITE_UPLOAD_MAX_PARTS = 32  # GCS composes at most 32 objects at once
 
-def download_monthly_data(year: int, month: int, ouput_dir: Path) -> Path:
-    file_download_url = f"{BTS_ROOT_URL}/On_Time_Reporting_Carrier_On_Time_Performance_1987_present_{year}_{month}.zip"
+# Arrow types of the columns used downstream, all other columns are stored as strings
+BTS_COLUMN_TYPES = {
+    "Year": "int16",
+    "Quarter": "int8",
+    "Month": "int8",
+    "DayofMonth": "int8",
+    "DayOfWeek": "int8",
+    "Flight_Number_Reporting_Airline": "int32",
+    "OriginAirportID": "int32",
+    "DestAirportID": "int32",
+    "DepDelay": "float32",
+    "TaxiOut": "float32",
+    "ArrDelay": "float32",
+    "Distance": "float32",
+    "Cancelled": "float32",
+    "Diverted": "float32",
+}
+
+# Columns read by the training and feature pipelines
+BTS_REDUCED_COLUMNS = [
+    "Year",
+    "Month",
+    "FlightDate",
+    "Reporting_Airline",
+    "Flight_Number_Reporting_Airline",
+    "OriginAirportID",
+    "DestAirportID",
+    "CRSDepTime",
+    "WheelsOff",
+    "DepDelay",
+    "TaxiOut",
+    "ArrDelay",
+    "Distance",
+    "Cancelled",
+    "Diverted",
+]
+
+
+def month_range(start: str, end: str):
+    """Returns all (year, month) pairs from `start` to `end` (both "YYYY-MM"), inclusive."""
+    start_year, start_month = map(int, start.split("-"))
+    end_year, end_month = map(int, end.split("-"))
+    return [
+        (index // 12, index % 12 + 1)
+        for index in range(start_year * 12 + start_month - 1, end_year * 12 + end_month)
+    ]
+
+
+def file_sha256(path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(1024 * 1024):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def load_checksums(output_dir: Path) -> dict:
+    checksum_file = output_dir / CHECKSUM_CACHE
+    if not checksum_file.exists():
+        return {}
+    return json.loads(checksum_file.read_text())
+
+
+def save_checksums(output_dir: Path, checksums: dict):
+    checksum_file = output_dir / CHECKSUM_CACHE
+    tmp_file = checksum_file.with_suffix(".tmp")
+    tmp_file.write_text(json.dumps(checksums, indent=2, sort_keys=True))
+    tmp_file.replace(checksum_file)
+
+
+def download_monthly_data(
+    year: int,
+    month: int,
+    ouput_dir: Path,
+    checksums: Optional[dict] = None,
+    root_url: str = BTS_ROOT_URL,
+) -> Path:
+    """Downloads the zip file of one month.
+
+    The download is written to a `.part` file first. If that file exists from
+    an interrupted run, only the missing bytes are requested with an HTTP range
+    request. Months whose zip file matches its entry in `checksums` are skipped,
+    and `checksums` is updated with the checksum of every new download.
+    """
+    file_download_url = f"{root_url}/On_Time_Reporting_Carrier_On_Time_Performance_1987_present_{year}_{month}.zip"
 
     output_file_path = ouput_dir / f"{year}_{month:02}.zip"
     output_file_path.parent.mkdir(exist_ok=True, parents=True)
+    checksums = {} if checksums is None else checksums
+
+    if output_file_path.exists():
+        checksum = checksums.get(output_file_path.name)
+        if checksum is not None and checksum == file_sha256(output_file_path):
+            return output_file_path
+        if checksum is None and zipfile.is_zipfile(output_file_path):
+            # Downloaded before the checksum cache existed
+            checksums[output_file_path.name] = file_sha256(output_file_path)
+            return output_file_path
+
+    partial_file_path = output_file_path.with_suffix(".zip.part")
+    offset = partial_file_path.stat().st_size if partial_file_path.exists() else 0
 
-    wget.download(file_download_url, output_file_path.as_posix())
+    request = urllib.request.Request(file_download_url)
+    if offset:
+        request.add_header("Range", f"bytes={offset}-")
+
+    try:
+        with urllib.request.urlopen(request) as response:
+            # Servers that don't support range requests send the whole file
+            mode = "ab" if response.status == 206 else "wb"
+            with open(partial_file_path, mode) as file:
+                while chunk := response.read(1024 * 1024):
+                    file.write(chunk)
+    except urllib.error.HTTPError as error:
+        # 416: the partial file already has all bytes
+        if error.code != 416:
+            raise
+
+    partial_file_path.replace(output_file_path)
+    checksums[output_file_path.name] = file_sha256(output_file_path)
 
     return output_file_path
 
 
-def extract_zipfile(zip_file: Path, output_dir: Path) -> Path:
-    with TemporaryDirectory() as tmpdir:
-        unpack_archive(zip_file, extract_dir=tmpdir)
+def download_data(
+    months, output_dir: Path, max_workers: int = 4, root_url: str = BTS_ROOT_URL
+):
+    """Downloads several months concurrently, skipping months that are already complete."""
+    output_dir.mkdir(exist_ok=True, parents=True)
+    checksums = load_checksums(output_dir)
+    lock = threading.Lock()
+
+    def download(year_month):
+        year, month = year_month
+        month_checksums = {}
+        name = f"{year}_{month:02}.zip"
+        with lock:
+            if name in checksums:
+                month_checksums[name] = checksums[name]
+
+        output_file = download_monthly_data(
+            year, month, output_dir, month_checksums, root_url
+        )
+
+        with lock:
+            checksums.update(month_checksums)
+            save_checksums(output_dir, checksums)
+        print("Downloaded:", output_file)
+        return output_file
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(download, months))
+
+
+def extract_zipfile(zip_file: Path, output_dir: Path, compress: bool = False) -> Path:
+    """Streams the CSV file of a zip file to `output_dir/year/year-month.csv`.
+
+    The CSV is written under a temporary name and renamed once it is complete.
+    With `compress`, it is gzip-compressed on the way (`year-month.csv.gz`).
+    Zip files that were extracted after their last download are skipped.
+    """
+    year = int(zip_file.name.split(".")[0].split("_")[-2])
+    month = int(zip_file.name.split(".")[0].split("_")[-1])
+    output_file = output_dir / f"{year}" / f"{year}-{month:02}.csv"
+    if compress:
+        output_file = output_file.with_suffix(".csv.gz")
+
+    if output_file.exists() and output_file.stat().st_mtime >= zip_file.stat().st_mtime:
+        return output_file
+
+    output_file.parent.mkdir(exist_ok=True, parents=True)
+    tmp_file = output_file.with_name(output_file.name + ".tmp")
 
-        csv_files = list(Path(tmpdir).glob("*.csv"))
+    with zipfile.ZipFile(zip_file) as archive, open(tmp_file, "wb") as file:
+        csv_files = [name for name in archive.namelist() if name.endswith(".csv")]
         assert len(csv_files) == 1, "There should be exactly one *.csv file per zip"
 
-        year = int(zip_file.name.split(".")[0].split("_")[-2])
-        month = int(zip_file.name.split(".")[0].split("_")[-1])
-        output_file = output_dir / f"{year}" / f"{year}-{month:02}.csv"
+        # Without a timestamp and file name in the gzip header, the same zip
+        # always gives the same bytes, so the upload of unchanged months is skipped
+        with archive.open(csv_files[0]) as source, (
+            gzip.GzipFile(
+                filename="", mode="wb", compresslevel=6, fileobj=file, mtime=0
+            )
+            if compress
+            else file
+        ) as target:
+            copyfileobj(source, target, 1024 * 1024)
 
-        output_file.parent.mkdir(exist_ok=True, parents=True)
+    tmp_file.replace(output_file)
 
-        move(csv_files[0], output_file)
+    return output_file
 
+
+def extract_data(
+    input_dir: Path,
+    output_dir: Path,
+    max_workers: Optional[int] = None,
+    compress: bool = False,
+):
+    """Extracts all zip files in `input_dir` in parallel processes."""
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(extract_zipfile, zip_filepath, output_dir, compress)
+            for zip_filepath in sorted(input_dir.glob("*.zip"))
+        ]
+        for future in as_completed(futures):
+            print("Extracted:", future.result())
+
+
+def convert_to_parquet(
+    csv_file: Path, output_dir: Path, columns: Optional[list] = None
+) -> Path:
+    """Converts a monthly CSV file to `output_dir/year=YYYY/month=MM/YYYY-MM.parquet`.
+
+    Columns in `BTS_COLUMN_TYPES` are stored with their type, all other
+    columns as strings. `columns` restricts the file to a subset of the
+    columns. The CSV is converted block by block, so memory stays bounded.
+    Months converted after their CSV was last extracted, with the same
+    columns, are skipped.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+
+    year, month = map(int, csv_file.name.split(".")[0].split("-"))
+    output_file = (
+        output_dir / f"year={year}" / f"month={month:02}" / f"{year}-{month:02}.parquet"
+    )
+    output_file.parent.mkdir(exist_ok=True, parents=True)
+    tmp_file = output_file.with_name(output_file.name + ".tmp")
+
+    with (gzip.open if csv_file.suffix == ".gz" else open)(
+        csv_file, "rt", newline=""
+    ) as file:
+        header = next(csv.reader(file))
+    # BTS rows end with a trailing comma, which adds an unnamed empty column
+    columns = columns or [name for name in header if name]
+
+    if (
+        output_file.exists()
+        and output_file.stat().st_mtime >= csv_file.stat().st_mtime
+        and pq.read_schema(output_file).names == columns
+    ):
         return output_file
 
+    reader = pa_csv.open_csv(
+        csv_file,
+        read_options=pa_csv.ReadOptions(block_size=64 * 1024 * 1024),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=columns,
+            column_types={
+                name: pa.type_for_alias(BTS_COLUMN_TYPES.get(name, "string"))
+                for name in columns
+            },
+        ),
+    )
+    with pq.ParquetWriter(tmp_file, reader.schema, compression="snappy") as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+
+    tmp_file.replace(output_file)
+
+    return output_file
+
+
+def convert_data(
+    input_dir: Path,
+    output_dir: Path,
+    columns: Optional[list] = None,
+    max_workers: Optional[int] = None,
+):
+    """Converts all extracted monthly CSV files in `input_dir` to a partitioned Parquet dataset."""
+    csv_files = sorted([*input_dir.glob("*/*.csv"), *input_dir.glob("*/*.csv.gz")])
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(convert_to_parquet, csv_file, output_dir, columns)
+            for csv_file in csv_files
+        ]
+        for future in as_completed(futures):
+            print("Converted:", future.result())
+
+
+def upload_file(fs, local_file: Path, remote_path: str, max_workers: int = 8):
+    """Uploads a file to `remote_path` on the fsspec filesystem `fs`.
+
+    Large files are uploaded as parts in parallel and then composed into one
+    object, if the filesystem supports it (`merge` on GCS and S3). Other
+    filesystems get a single upload.
+    """
+    size = local_file.stat().st_size
+    fs.makedirs(posixpath.dirname(remote_path), exist_ok=True)
 
-def extract_data(input_dir: Path, output_dir: Path):
-    for zip_filepath in input_dir.glob("*.zip"):
-        output_file = extract_zipfile(zip_filepath, output_dir)
-        print("Extracted:", output_file)
+    if size <= COMPOSITE_UPLOAD_PART_SIZE or not hasattr(fs, "merge"):
+        fs.put_file(str(local_file), remote_path)
+        return
+
+    part_size = max(COMPOSITE_UPLOAD_PART_SIZE, -(-size // COMPOSITE_UPLOAD_MAX_PARTS))
+    part_paths = [
+        f"{remote_path}.part{index:02}" for index in range(-(-size // part_size))
+    ]
+
+    def upload_part(index):
+        remaining = part_size
+        with open(local_file, "rb") as source, fs.open(
+            part_paths[index], "wb"
+        ) as target:
+            source.seek(index * part_size)
+            while remaining > 0 and (
+                chunk := source.read(min(remaining, 8 * 1024 * 1024))
+            ):
+                target.write(chunk)
+                remaining -= len(chunk)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(upload_part, range(len(part_paths))))
+
+    fs.merge(remote_path, part_paths)
+    fs.rm(part_paths)
+
+
+def upload_data(local_dir: Path, destination: str, max_workers: int = 8):
+    """Uploads all files in `local_dir` to `destination` (any fsspec URL or a local directory).
+
+    A manifest of the uploaded files and their checksums is stored in
+    `destination`. Files that are unchanged since their last upload are skipped.
+    Returns the names of the uploaded files, so an unchanged `local_dir` gives [].
+    """
+    from fsspec.core import url_to_fs
+
+    fs, root = url_to_fs(destination)
+    manifest_path = f"{root}/{UPLOAD_MANIFEST}"
+    manifest = (
+        json.loads(fs.cat_file(manifest_path)) if fs.exists(manifest_path) else {}
+    )
+
+    def upload(local_file):
+        name = local_file.relative_to(local_dir).as_posix()
+        checksum = file_sha256(local_file)
+        remote_path = f"{root}/{name}"
+        if manifest.get(name) == checksum and fs.exists(remote_path):
+            return name, checksum, False
+
+        upload_file(fs, local_file, remote_path)
+        return name, checksum, True
+
+    files = [
+        path
+        for path in sorted(local_dir.rglob("*"))
+        if path.is_file() and not path.name.endswith(".tmp")
+    ]
+    uploaded_names = []
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(upload, path) for path in files]
+            for future in as_completed(futures):
+                name, checksum, uploaded = future.result()
+                manifest[name] = checksum
+                if uploaded:
+                    uploaded_names.append(name)
+                    print("Uploaded:", name)
+    finally:
+        # Keep the files uploaded so far, even if another upload failed
+        fs.pipe_file(
+            manifest_path, json.dumps(manifest, indent=2, sort_keys=True).encode()
+        )
+
+    return sorted(uploaded_names)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--start", default="2021-12", help="First month (YYYY-MM).")
+    parser.add_argument("--end", default="2021-12", help="Last month (YYYY-MM).")
+    parser.add_argument(
+        "--workers", type=int, default=4, help="Number of concurrent downloads."
+    )
+    parser.add_argument(
+        "--extract-workers",
+        dest="extract_workers",
+        type=int,
+        default=None,
+        help="Number of processes extracting zip files. Defaults to the number of CPUs.",
+    )
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="Store the extracted CSVs gzip-compressed.",
+    )
+    parser.add_argument(
+        "--reduced-columns",
+        dest="reduced_columns",
+        action="store_true",
+        help="Only keep the columns used by the pipelines in the Parquet dataset.",
+    )
+    parser.add_argument(
+        "--destination",
+        default=None,
+        help="Where to upload the processed data (any fsspec URL). Defaults to gs://BUCKET/data.",
+    )
+    parser.add_argument(
+        "--upload-workers",
+        dest="upload_workers",
+        type=int,
+        default=8,
+        help="Number of concurrent uploads.",
+    )
+    args = parser.parse_args()
+
     INPUT_DIR = Path("./data/raw")
     OUTPUT_DIR = Path("./data/processed")
     BUCKET = "XXX"  # TODO: Replace with your bucket name
 
-    download_monthly_data(2021, 12, INPUT_DIR)
-    extract_data(INPUT_DIR, OUTPUT_DIR)
-    subprocess.check_call(["gsutil", "cp", "-r", OUTPUT_DIR.absolute(), f"gs://{BUCKET}/data"])
+    download_data(month_range(args.start, args.end), INPUT_DIR, args.workers)
+    extract_data(INPUT_DIR, OUTPUT_DIR, args.extract_workers, args.compress)
+    convert_data(
+        OUTPUT_DIR,
+        OUTPUT_DIR / "parquet",
+        BTS_REDUCED_COLUMNS if args.reduced_columns else None,
+        args.extract_workers,
+    )
+    destination = args.destination or f"gs://{BUCKET}/data"
+    if not upload_data(OUTPUT_DIR, destination, args.upload_workers):
+        print("Nothing to upload,", destination, "is up to date")
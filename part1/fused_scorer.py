@@ -0,0 +1,145 @@
+"""Scores flights with the `model.npz` artifact written by `model_train`.
+
+The imputer, scaler and classifier of the model pipeline are folded into fill
+values for missing features, one weight vector and a bias. Scoring is a single
+dot product and needs nothing but numpy:
+
+    scorer = FusedScorer.load("model/model.npz")
+    scorer.predict_proba([481.0, -6.0, 13.0])
+
+The probabilities equal those of `predict_proba` of the pickled pipeline up
+to floating point rounding (the folded operations are summed in a different
+order). To compare both on a dataset written by `data_download`:
+
+    python -m part1.fused_scorer --model-dir=local_pipeline_output/model_train/model \
+        --dataset=local_pipeline_output/data_download/dataset_test
+"""
+
+import argparse
+import pickle
+import subprocess
+import sys
+import time
+import warnings
+
+import numpy as np
+
+
+class FusedScorer:
+    def __init__(self, fill_values, weights, bias, classes):
+        self.fill_values = fill_values
+        self.weights = weights
+        self.bias = bias
+        self.classes = classes
+
+    @classmethod
+    def load(cls, path: str) -> "FusedScorer":
+        with np.load(path) as artifact:
+            return cls(
+                artifact["fill_values"],
+                artifact["weights"],
+                float(artifact["bias"]),
+                artifact["classes"],
+            )
+
+    def decision_function(self, X) -> np.ndarray:
+        """Takes one row or a 2D batch of rows with the features in training order."""
+        X = np.asarray(X, dtype=np.float64)
+        X = np.where(np.isnan(X), self.fill_values, X)
+        return X @ self.weights + self.bias
+
+    def predict_proba(self, X) -> np.ndarray:
+        with np.errstate(over="ignore"):
+            positive = 1 / (1 + np.exp(-self.decision_function(X)))
+        return np.stack([1 - positive, positive], axis=-1)
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes[(self.decision_function(X) > 0).astype(int)]
+
+
+def read_features(path: str) -> np.ndarray:
+    import pandas as pd
+    import pyarrow as pa
+
+    with open(path, "rb") as file:
+        is_arrow = file.read(6) == b"ARROW1"
+    if is_arrow:
+        data = pa.ipc.open_file(pa.memory_map(path)).read_pandas()
+    else:
+        data = pd.read_csv(path)
+    return data.drop(columns=["target"]).to_numpy(dtype=np.float64)
+
+
+def timed(function, repeat: int = 1) -> float:
+    """Returns the mean wall time of `function` in seconds."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def cold_load_seconds(statement: str) -> float:
+    """Runs `statement` in a new interpreter, like a starting prediction server."""
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import time; start = time.perf_counter(); "
+            f"{statement}; print(time.perf_counter() - start)",
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return float(result.stdout)
+
+
+def compare(model_dir: str, dataset: str, repeat: int = 1000):
+    """Prints the load and scoring times of the pickled pipeline and the fused scorer."""
+    X = read_features(dataset)
+    # Like the prediction requests, the rows have no feature names
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+    with open(f"{model_dir}/model.pkl", "rb") as file:
+        pipeline = pickle.load(file)
+    scorer = FusedScorer.load(f"{model_dir}/model.npz")
+
+    difference = np.abs(
+        pipeline.predict_proba(X)[:, 1] - scorer.predict_proba(X)[:, 1]
+    ).max()
+    print(f"{len(X):,} rows, max probability difference {difference:.3g}")
+
+    print(f"{'':<10} {'cold load':>10} {'1 row':>10} {'batch rows/s':>14}")
+    for name, load, model in [
+        (
+            "pipeline",
+            f"import pickle; pickle.load(open('{model_dir}/model.pkl', 'rb'))",
+            pipeline,
+        ),
+        ("fused", f"import numpy; dict(numpy.load('{model_dir}/model.npz'))", scorer),
+    ]:
+        load_seconds = cold_load_seconds(load)
+        row_seconds = timed(lambda: model.predict_proba(X[:1]), repeat=repeat)
+        batch_seconds = timed(lambda: model.predict_proba(X), repeat=10)
+        print(
+            f"{name:<10} {load_seconds * 1e3:8.2f}ms {row_seconds * 1e6:8.1f}us "
+            f"{len(X) / batch_seconds:14,.0f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--model-dir",
+        dest="model_dir",
+        required=True,
+        help="Model artifact of model_train with model.pkl and model.npz.",
+    )
+    parser.add_argument(
+        "--dataset",
+        required=True,
+        help="Dataset written by data_download (Arrow or CSV).",
+    )
+    args = parser.parse_args()
+
+    compare(args.model_dir, args.dataset)
@@ -0,0 +1,325 @@
+"""Runs the training pipeline locally, without compiling it for Vertex AI.
+
+The `@component` functions of `training_pipeline.py` are executed in-process
+(threads) or in a process pool. Their `Input` / `Output` artifacts are local
+paths and independent steps run in parallel. The deploy ops are skipped.
+
+    python -m part1.local_runner --data-url=data/processed/parquet/year=2021/month=12
+"""
+
+import __future__
+import argparse
+import ast
+import json
+import shutil
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from functools import lru_cache
+from inspect import signature
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+TRAINING_PIPELINE = str(Path(__file__).parent / "training_pipeline.py")
+
+
+class LocalArtifact:
+    """Stand-in for the KFP artifact types (Dataset, Model, ClassificationMetrics, ...)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.uri = path
+        self.metadata = {}
+
+    def log_metric(self, metric: str, value: float):
+        self.metadata[metric] = value
+
+    def log_roc_curve(self, fpr: list, tpr: list, threshold: list):
+        self.metadata["confidenceMetrics"] = [
+            {"falsePositiveRate": f, "recall": r, "confidenceThreshold": t}
+            for f, r, t in zip(fpr, tpr, threshold)
+        ]
+
+    def log_confusion_matrix(self, categories: list, matrix: list):
+        self.metadata["confusionMatrix"] = {
+            "annotationSpecs": [{"displayName": category} for category in categories],
+            "rows": [{"row": row} for row in matrix],
+        }
+
+
+class StepOutput(NamedTuple):
+    """Reference to an output artifact of another step."""
+
+    step: str
+    output: str
+
+
+class Step(NamedTuple):
+    name: str
+    # Function name in the pipeline module, None for ops that are skipped
+    component: Optional[str]
+    arguments: dict  # parameter values and StepOutput references
+    after: tuple = ()  # steps to wait for, in addition to the referenced ones
+
+
+@lru_cache()
+def load_component(source_file: str, name: str):
+    """Compiles the function of a `@component` from the pipeline module, without the decorator.
+
+    Component functions are self-contained (KFP runs their source in the
+    container), so neither the rest of the module nor kfp needs to be
+    imported. Annotations are not evaluated.
+    """
+    source = Path(source_file).read_text()
+    for node in ast.parse(source).body:
+        if isinstance(node, ast.FunctionDef) and node.name == name:
+            node.decorator_list = []
+            code = compile(
+                ast.Module(body=[node], type_ignores=[]),
+                source_file,
+                "exec",
+                flags=__future__.annotations.compiler_flag,
+                dont_inherit=True,
+            )
+            namespace = {}
+            exec(code, namespace)
+            return namespace[name]
+
+    raise ValueError(f"There is no component {name} in {source_file}")
+
+
+def execute_step(source_file: str, component: str, arguments: dict, step_dir: str):
+    """Runs a component and returns its outputs and wall time in seconds.
+
+    Parameters annotated with `Output[...]` are output artifacts and
+    `OutputPath(...)` parameters get a file path, both in `step_dir`. Other
+    parameters without an argument keep their default value.
+    """
+    function = load_component(source_file, component)
+
+    shutil.rmtree(step_dir, ignore_errors=True)
+    Path(step_dir).mkdir(parents=True)
+    outputs = {}
+    output_paths = {}
+    for name, parameter in signature(function).parameters.items():
+        # Annotations are not evaluated, they are the source strings
+        annotation = str(parameter.annotation).replace(" ", "")
+        if annotation.startswith(("Output[", "dsl.Output[")):
+            outputs[name] = LocalArtifact(f"{step_dir}/{name}")
+        elif annotation.startswith(("OutputPath(", "dsl.OutputPath(")):
+            output_paths[name] = f"{step_dir}/{name}"
+        elif name not in arguments and parameter.default is parameter.empty:
+            raise TypeError(f"{component} is missing the argument {name}")
+
+    start = time.perf_counter()
+    function(**arguments, **outputs, **output_paths)
+    seconds = time.perf_counter() - start
+
+    for artifact in outputs.values():
+        if artifact.metadata:
+            Path(f"{artifact.path}.metadata.json").write_text(
+                json.dumps(artifact.metadata, indent=2)
+            )
+
+    return {**outputs, **output_paths}, seconds
+
+
+def run_pipeline(
+    steps: list,
+    output_dir: str,
+    source_file: str = TRAINING_PIPELINE,
+    executor: str = "process",
+    max_workers: Optional[int] = None,
+) -> dict:
+    """Runs the steps as soon as the steps they depend on are done.
+
+    Returns the output artifacts of every step.
+    """
+    dependencies = {
+        step.name: {
+            argument.step
+            for argument in step.arguments.values()
+            if isinstance(argument, StepOutput)
+        }
+        | set(step.after)
+        for step in steps
+    }
+
+    results = {}
+    timings = {}
+    pending = list(steps)
+    running = {}
+
+    pool_class = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+    with pool_class(max_workers=max_workers) as pool:
+        while pending or running:
+            ready = [
+                step for step in pending if dependencies[step.name] <= set(results)
+            ]
+            for step in ready:
+                pending.remove(step)
+                if step.component is None:
+                    results[step.name] = {}
+                    timings[step.name] = None
+                    continue
+
+                arguments = {
+                    name: (
+                        results[value.step][value.output]
+                        if isinstance(value, StepOutput)
+                        else value
+                    )
+                    for name, value in step.arguments.items()
+                }
+                future = pool.submit(
+                    execute_step,
+                    source_file,
+                    step.component,
+                    arguments,
+                    f"{output_dir}/{step.name}",
+                )
+                running[future] = step
+
+            if any(step.component is None for step in ready):
+                # Skipped steps can unblock others right away
+                continue
+            if not running:
+                raise ValueError(
+                    f"Unknown dependencies of {[step.name for step in pending]}"
+                )
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                results[step.name], timings[step.name] = future.result()
+                print(f"Finished {step.name} in {timings[step.name]:.2f}s")
+
+    print(f"{'step':<20} {'seconds':>10}")
+    for step in steps:
+        seconds = timings[step.name]
+        print(
+            f"{step.name:<20} {'skipped' if seconds is None else f'{seconds:.2f}':>10}"
+        )
+
+    return results
+
+
+def training_steps(
+    data_url: str,
+    split_date: str,
+    dataset_format: str = "arrow",
+    training_mode: str = "batch",
+    training_workers: int = 4,
+):
+    """The steps of `training_pipeline.pipeline`."""
+    return [
+        Step(
+            "data_download",
+            "data_download",
+            {
+                "data_url": data_url,
+                "split_date": split_date,
+                "dataset_format": dataset_format,
+            },
+        ),
+        Step(
+            "model_train",
+            "model_train",
+            {
+                "dataset": StepOutput("data_download", "dataset_train"),
+                "training_mode": training_mode,
+                "training_workers": training_workers,
+            },
+        ),
+        Step(
+            "model_evaluate",
+            "model_evaluate",
+            {
+                "test_set": StepOutput("data_download", "dataset_test"),
+                "model": StepOutput("model_train", "model"),
+            },
+        ),
+        # Deployment only happens on Vertex AI
+        Step("model_upload", None, {}, after=("model_evaluate",)),
+        Step("endpoint_create", None, {}),
+        Step("model_deploy", None, {}, after=("model_upload", "endpoint_create")),
+    ]
+
+
+def add_runner_arguments(parser):
+    parser.add_argument(
+        "--split-date",
+        dest="split_date",
+        default="2021-12-20",
+        help="Flights on or after this date are the test set.",
+    )
+    parser.add_argument(
+        "--dataset-format",
+        dest="dataset_format",
+        choices=["arrow", "csv"],
+        default="arrow",
+        help="Format of the datasets passed between the steps.",
+    )
+    parser.add_argument(
+        "--training-mode",
+        dest="training_mode",
+        choices=["batch", "streaming", "search", "distributed"],
+        default="batch",
+        help="Fit the model in memory, with partial_fit over chunks of the data,"
+        " with a hyperparameter search or on data-parallel worker processes.",
+    )
+    parser.add_argument(
+        "--training-workers",
+        dest="training_workers",
+        type=int,
+        default=4,
+        help="Number of worker processes of the distributed training mode.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        dest="output_dir",
+        default="local_pipeline_output",
+        help="Directory for the artifacts of every step.",
+    )
+    parser.add_argument(
+        "--executor",
+        choices=["process", "thread"],
+        default="process",
+        help="Run the steps in a process pool or in threads of this process.",
+    )
+    parser.add_argument(
+        "--max-workers",
+        dest="max_workers",
+        type=int,
+        default=None,
+        help="Maximum number of steps running at the same time.",
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--data-url",
+        dest="data_url",
+        required=True,
+        help="BTS CSV file(s) or Parquet dataset to train on.",
+    )
+    add_runner_arguments(parser)
+    args = parser.parse_args()
+
+    run_pipeline(
+        training_steps(
+            args.data_url,
+            args.split_date,
+            args.dataset_format,
+            args.training_mode,
+            args.training_workers,
+        ),
+        args.output_dir,
+        executor=args.executor,
+        max_workers=args.max_workers,
+    )
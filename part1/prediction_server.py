@@ -0,0 +1,303 @@
+"""Local HTTP prediction server for the `model.pkl` artifact of `model_train`.
+
+Requests and responses have the format of the Vertex AI prediction endpoints,
+so `predict.py` callers can be pointed at it:
+
+    python -m part1.prediction_server serve --model-dir=local_pipeline_output/model_train/model
+    curl -X POST localhost:8080/predict -d '{"instances": [[481.0, -6.0, 13.0]]}'
+
+Concurrent requests are scored together: the instances of all requests arriving
+within `--max-wait-ms` of the first one are collected into one micro-batch of
+up to `--max-batch-size` instances, which takes a single `predict` call.
+`GET /stats` returns the throughput, the mean batch size and the latency
+percentiles. `benchmark` sends concurrent requests with rows of a dataset
+written by `data_download`, to tune the two settings:
+
+    python -m part1.prediction_server benchmark \
+        --dataset=local_pipeline_output/data_download/dataset_test --concurrency=32
+"""
+
+import argparse
+import collections
+import http.client
+import json
+import pickle
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+
+
+def percentiles(values) -> dict:
+    values = np.asarray(values, dtype=np.float64) * 1e3
+    if not len(values):
+        return {}
+    return {f"p{q}": float(np.percentile(values, q)) for q in (50, 90, 99)}
+
+
+class ServerStats:
+    """Counts of all requests, latencies and batch sizes of the most recent ones."""
+
+    def __init__(self, window: int = 100_000):
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.requests = 0
+        self.instances = 0
+        self.latencies = collections.deque(maxlen=window)
+        self.batch_sizes = collections.deque(maxlen=window)
+
+    def record_request(self, seconds: float, instances: int):
+        with self.lock:
+            self.requests += 1
+            self.instances += instances
+            self.latencies.append(seconds)
+
+    def record_batch(self, instances: int):
+        with self.lock:
+            self.batch_sizes.append(instances)
+
+    def summary(self) -> dict:
+        with self.lock:
+            seconds = time.perf_counter() - self.start
+            return {
+                "requests": self.requests,
+                "instances": self.instances,
+                "instancesPerSecond": self.instances / seconds,
+                "meanBatchSize": (
+                    float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0
+                ),
+                "latencyMs": percentiles(self.latencies),
+            }
+
+
+class MicroBatcher:
+    """Scores the instances of concurrent requests with one `predict` call."""
+
+    def __init__(self, model, max_batch_size: int = 256, max_wait_seconds=0.005):
+        self.model = model
+        # The model pipeline is fitted on a DataFrame, so its feature names are known
+        self.columns = getattr(model, "feature_names_in_", None)
+        self.num_features = model.n_features_in_
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.stats = ServerStats()
+        self.requests = queue.Queue()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def predict(self, instances: list) -> list:
+        """Blocks until the batch with these instances is scored."""
+        X = np.asarray(instances, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.num_features:
+            raise ValueError(f"Expected instances with {self.num_features} features")
+        future = Future()
+        self.requests.put((X, future, time.perf_counter()))
+        return future.result()
+
+    def next_batch(self) -> list:
+        batch = [self.requests.get()]
+        size = len(batch[0][0])
+        deadline = batch[0][2] + self.max_wait_seconds
+        while size < self.max_batch_size:
+            # Requests queued while the previous batch was scored are taken at once
+            timeout = deadline - time.perf_counter()
+            try:
+                if timeout > 0:
+                    request = self.requests.get(timeout=timeout)
+                else:
+                    request = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request[0])
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            X = np.concatenate([request_X for request_X, _, _ in batch])
+            if self.columns is not None:
+                X = pd.DataFrame(X, columns=self.columns)
+            try:
+                predictions = self.model.predict(X).tolist()
+            except Exception as error:
+                for _, future, _ in batch:
+                    future.set_exception(error)
+                continue
+
+            self.stats.record_batch(len(X))
+            offset = 0
+            for request_X, future, _ in batch:
+                future.set_result(predictions[offset : offset + len(request_X)])
+                offset += len(request_X)
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    # Keeps the connections of the callers open between requests
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        start = time.perf_counter()
+        if self.path != "/predict":
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+
+        batcher = self.server.batcher
+        try:
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            predictions = batcher.predict(body["instances"])
+        except (KeyError, TypeError, ValueError) as error:
+            self.send_json(400, {"error": str(error)})
+            return
+
+        self.send_json(200, {"predictions": predictions})
+        batcher.stats.record_request(time.perf_counter() - start, len(predictions))
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self.send_json(200, self.server.batcher.stats.summary())
+        else:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # A log line per request would cost more than scoring it
+        pass
+
+
+class PredictionServer(ThreadingHTTPServer):
+    # Every concurrent caller connects at once, the default backlog is 5
+    request_queue_size = 128
+
+
+def serve(
+    model_dir: str,
+    port: int = 8080,
+    max_batch_size: int = 256,
+    max_wait_seconds: float = 0.005,
+):
+    with open(f"{model_dir}/model.pkl", "rb") as file:
+        model = pickle.load(file)
+
+    server = PredictionServer(("", port), PredictionHandler)
+    server.batcher = MicroBatcher(model, max_batch_size, max_wait_seconds)
+    print(f"Serving {model_dir} on port {port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.batcher.stats.summary(), indent=2))
+
+
+def benchmark(
+    url: str,
+    dataset: str,
+    requests: int = 10_000,
+    concurrency: int = 32,
+    instances_per_request: int = 1,
+):
+    """Sends requests from `concurrency` threads and prints the client side latencies."""
+    from .fused_scorer import read_features
+
+    X = read_features(dataset)
+    # JSON has no NaN, missing features are sent as null
+    rows = [[None if np.isnan(value) else value for value in row] for row in X.tolist()]
+    address = urlparse(url)
+    local = threading.local()
+
+    def send(index: int) -> float:
+        if not hasattr(local, "connection"):
+            local.connection = http.client.HTTPConnection(
+                address.hostname, address.port
+            )
+        start = index * instances_per_request % len(rows)
+        body = json.dumps({"instances": rows[start : start + instances_per_request]})
+
+        request_start = time.perf_counter()
+        local.connection.request("POST", "/predict", body)
+        response = local.connection.getresponse()
+        response.read()
+        if response.status != 200:
+            raise RuntimeError(f"Request failed with status {response.status}")
+        return time.perf_counter() - request_start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(send, range(requests)))
+    seconds = time.perf_counter() - start
+
+    print(f"{requests:,} requests in {seconds:.1f}s")
+    print(f"{requests * instances_per_request / seconds:,.0f} instances/s")
+    print(f"client latency ms: {percentiles(latencies)}")
+
+    connection = http.client.HTTPConnection(address.hostname, address.port)
+    connection.request("GET", "/stats")
+    print(f"server: {json.loads(connection.getresponse().read())}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Serve a model.")
+    serve_parser.add_argument(
+        "--model-dir",
+        dest="model_dir",
+        required=True,
+        help="Model artifact of model_train with model.pkl.",
+    )
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument(
+        "--max-batch-size",
+        dest="max_batch_size",
+        type=int,
+        default=256,
+        help="A batch is scored once it has this many instances.",
+    )
+    serve_parser.add_argument(
+        "--max-wait-ms",
+        dest="max_wait_ms",
+        type=float,
+        default=5.0,
+        help="Maximum time a request waits for other requests to batch with.",
+    )
+
+    benchmark_parser = subparsers.add_parser(
+        "benchmark", help="Send concurrent requests to a running server."
+    )
+    benchmark_parser.add_argument("--url", default="http://localhost:8080")
+    benchmark_parser.add_argument(
+        "--dataset",
+        required=True,
+        help="Dataset written by data_download (Arrow or CSV).",
+    )
+    benchmark_parser.add_argument("--requests", type=int, default=10_000)
+    benchmark_parser.add_argument("--concurrency", type=int, default=32)
+    benchmark_parser.add_argument(
+        "--instances-per-request", dest="instances_per_request", type=int, default=1
+    )
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.model_dir, args.port, args.max_batch_size, args.max_wait_ms / 1e3)
+    else:
+        benchmark(
+            args.url,
+            args.dataset,
+            args.requests,
+            args.concurrency,
+            args.instances_per_request,
+        )
@@ -0,0 +1,160 @@
+import io
+import os
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pyarrow.parquet as pq
+import pytest
+
+from part1.download_data import (
+    BTS_REDUCED_COLUMNS,
+    convert_data,
+    download_data,
+    download_monthly_data,
+    extract_data,
+    upload_data,
+)
+
+CSV_HEADER = ",".join(BTS_REDUCED_COLUMNS) + ",\n"
+CSV_ROW = "2021,12,2021-12-24,AA,100,10397,12892,0900,0915,5.00,10.00,-3.00,481.00,0.00,0.00,\n"
+
+
+def month_zip(rows: int) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("On_Time.csv", CSV_HEADER + CSV_ROW * rows)
+        archive.writestr("readme.html", "<html></html>")
+    return buffer.getvalue()
+
+
+def month_path(year: int, month: int) -> str:
+    return f"/On_Time_Reporting_Carrier_On_Time_Performance_1987_present_{year}_{month}.zip"
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """Serves `files` and supports `Range: bytes=N-` requests like the BTS server."""
+
+    files = {}
+    requests = []
+
+    def do_GET(self):
+        byte_range = self.headers.get("Range")
+        self.requests.append((self.path, byte_range))
+        if self.path not in self.files:
+            self.send_error(404)
+            return
+
+        data = self.files[self.path]
+        start = int(byte_range[len("bytes=") : -1]) if byte_range else 0
+        if start >= len(data) > 0:
+            self.send_error(416)
+            return
+
+        self.send_response(206 if byte_range else 200)
+        self.send_header("Content-Length", str(len(data) - start))
+        self.end_headers()
+        self.wfile.write(data[start:])
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def bts_server():
+    RangeRequestHandler.files = {}
+    RangeRequestHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", RangeRequestHandler
+    server.shutdown()
+    thread.join()
+
+
+def test_download_resumes_partial_file(tmp_path, bts_server):
+    root_url, handler = bts_server
+    data = month_zip(1000)
+    handler.files[month_path(2021, 12)] = data
+    (tmp_path / "2021_12.zip.part").write_bytes(data[:1000])
+
+    checksums = {}
+    output_file = download_monthly_data(2021, 12, tmp_path, checksums, root_url)
+
+    assert output_file.read_bytes() == data
+    assert handler.requests == [(month_path(2021, 12), "bytes=1000-")]
+    assert set(checksums) == {"2021_12.zip"}
+    assert not (tmp_path / "2021_12.zip.part").exists()
+
+
+def test_download_skips_months_that_are_up_to_date(tmp_path, bts_server):
+    root_url, handler = bts_server
+    for month in (11, 12):
+        handler.files[month_path(2021, month)] = month_zip(month)
+
+    months = [(2021, 11), (2021, 12)]
+    download_data(months, tmp_path, root_url=root_url)
+    assert len(handler.requests) == 2
+
+    download_data(months, tmp_path, root_url=root_url)
+    assert len(handler.requests) == 2
+
+    # A file that no longer matches its checksum is downloaded again
+    (tmp_path / "2021_12.zip").write_bytes(b"corrupt")
+    download_data(months, tmp_path, root_url=root_url)
+    assert handler.requests[2:] == [(month_path(2021, 12), None)]
+    assert (tmp_path / "2021_12.zip").read_bytes() == month_zip(12)
+
+
+def test_extract_and_convert(tmp_path):
+    raw_dir, processed_dir = tmp_path / "raw", tmp_path / "processed"
+    raw_dir.mkdir()
+    (raw_dir / "2021_12.zip").write_bytes(month_zip(3))
+
+    extract_data(raw_dir, processed_dir, max_workers=1, compress=True)
+    csv_file = processed_dir / "2021" / "2021-12.csv.gz"
+    convert_data(processed_dir, processed_dir / "parquet", max_workers=1)
+    parquet_file = processed_dir / "parquet/year=2021/month=12/2021-12.parquet"
+
+    table = pq.read_table(parquet_file)
+    assert table.num_rows == 3
+    # The trailing comma of the BTS rows adds no column
+    assert table.column_names == BTS_REDUCED_COLUMNS
+    assert table.column("DepDelay").to_pylist() == [5.0] * 3
+
+    # Unchanged inputs are neither extracted nor converted again
+    modified = {path: path.stat().st_mtime_ns for path in (csv_file, parquet_file)}
+    extract_data(raw_dir, processed_dir, max_workers=1, compress=True)
+    convert_data(processed_dir, processed_dir / "parquet", max_workers=1)
+    assert {path: path.stat().st_mtime_ns for path in modified} == modified
+
+    # A changed column selection is converted again
+    convert_data(
+        processed_dir, processed_dir / "parquet", ["FlightDate", "DepDelay"], 1
+    )
+    assert pq.read_schema(parquet_file).names == ["FlightDate", "DepDelay"]
+
+
+def test_upload_is_idempotent(tmp_path):
+    local_dir, destination = tmp_path / "processed", tmp_path / "bucket"
+    (local_dir / "2021").mkdir(parents=True)
+    (local_dir / "2021" / "2021-11.csv").write_text(CSV_HEADER)
+    (local_dir / "2021" / "2021-12.csv").write_text(CSV_HEADER + CSV_ROW)
+    (local_dir / "2021" / "2021-10.csv.tmp").write_text("incomplete")
+
+    assert upload_data(local_dir, str(destination)) == [
+        "2021/2021-11.csv",
+        "2021/2021-12.csv",
+    ]
+    assert (destination / "2021" / "2021-12.csv").read_text() == CSV_HEADER + CSV_ROW
+    assert not (destination / "2021" / "2021-10.csv.tmp").exists()
+
+    assert upload_data(local_dir, str(destination)) == []
+
+    (local_dir / "2021" / "2021-12.csv").write_text(CSV_HEADER + CSV_ROW * 2)
+    os.remove(destination / "2021" / "2021-11.csv")
+    assert upload_data(local_dir, str(destination)) == [
+        "2021/2021-11.csv",
+        "2021/2021-12.csv",
+    ]
+    assert upload_data(local_dir, str(destination)) == []
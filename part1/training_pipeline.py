@@ -25,62 +25,469 @@ pipeline_root_path = f"gs://{BUCKET}/pipeline-output/"
 
 @component(
     base_image="europe-docker.pkg.dev/vertex-ai/prediction/sklearn-cpu.1-0:latest",
+    packages_to_install=["pyarrow"],
 )
 def data_download(
     data_url: str,
     split_date: str,
+    dataset_format: str,
     dataset_train: Output[Dataset],
     dataset_test: Output[Dataset],
 ):
+    import fsspec
     import pandas as pd
+    import pyarrow as pa
+    import pyarrow.dataset as ds
 
     import logging
 
     logging.warn("Import file:", data_url)
 
-    data = pd.read_csv(data_url)
-
-    cancelled = (data["Cancelled"] > 0) | (data["Diverted"] > 0)
-    completed_flights = data[~cancelled]
-
-    training_data = completed_flights[["DepDelay", "TaxiOut", "Distance"]]
-    # Consider flights that arrive more than 15 min late as delayed
-    training_data["target"] = completed_flights["ArrDelay"] > 15
-
-    test_data = training_data[completed_flights["FlightDate"] >= split_date]
-    training_data = training_data[completed_flights["FlightDate"] < split_date]
-
-    training_data.to_csv(dataset_train.path, index=False)
-    test_data.to_csv(dataset_test.path, index=False)
+    # Read only the needed columns in chunks, so memory doesn't grow with the data
+    dtypes = {
+        "FlightDate": "string",
+        "DepDelay": "float32",
+        "TaxiOut": "float32",
+        "Distance": "float32",
+        "ArrDelay": "float32",
+        "Cancelled": "float32",
+        "Diverted": "float32",
+    }
+    chunk_size = 500_000
+
+    def read_chunks():
+        if data_url.endswith((".csv", ".csv.gz")):
+            # A single file or a glob of monthly files
+            for file in fsspec.open_files(data_url, compression="infer"):
+                with file as f:
+                    yield from pd.read_csv(
+                        f, usecols=list(dtypes), dtype=dtypes, chunksize=chunk_size
+                    )
+        else:
+            # Parquet dataset written by download_data.py
+            dataset = ds.dataset(data_url, format="parquet", partitioning="hive")
+            for batch in dataset.to_batches(
+                columns=list(dtypes), batch_size=chunk_size
+            ):
+                yield batch.to_pandas()
+
+    # Arrow IPC files (memory-mappable, typed) or CSV files, appended chunk by chunk
+    writers = {}
+
+    def write(path, df):
+        if dataset_format == "arrow":
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if path not in writers:
+                writers[path] = pa.ipc.new_file(path, table.schema)
+            writers[path].write_table(table)
+        else:
+            df.to_csv(
+                path,
+                mode="a" if path in writers else "w",
+                header=path not in writers,
+                index=False,
+            )
+            writers[path] = None
+
+    for chunk in read_chunks():
+        completed = ~((chunk["Cancelled"] > 0) | (chunk["Diverted"] > 0))
+        completed_flights = chunk[completed]
+
+        training_data = completed_flights[["DepDelay", "TaxiOut", "Distance"]]
+        # Consider flights that arrive more than 15 min late as delayed
+        training_data = training_data.assign(
+            target=completed_flights["ArrDelay"] > 15
+        )
+        is_test = (completed_flights["FlightDate"] >= split_date).to_numpy(dtype=bool)
+
+        write(dataset_train.path, training_data[~is_test])
+        write(dataset_test.path, training_data[is_test])
+
+    for writer in writers.values():
+        if writer is not None:
+            writer.close()
 
 
 @component(
     base_image="europe-docker.pkg.dev/vertex-ai/prediction/sklearn-cpu.1-0:latest",
+    packages_to_install=["pyarrow"],
 )
 def model_train(
     dataset: Input[Dataset],
     model: Output[Artifact],
+    training_mode: str = "batch",
+    training_workers: int = 4,
 ):
+    import numpy as np
     import pandas as pd
     import pickle
+    import pyarrow as pa
+    import sklearn
     from sklearn.pipeline import Pipeline
     from sklearn.impute import SimpleImputer
     from sklearn.preprocessing import StandardScaler
-    from sklearn.linear_model import LogisticRegression
-
-    data = pd.read_csv(dataset.path)
-    X = data.drop(columns=["target"])
-    y = data["target"]
-
-    model_pipeline = Pipeline(
-        [
-            ("imputer", SimpleImputer(strategy="median")),
-            ("scaler", StandardScaler()),
-            ("clf", LogisticRegression(random_state=42)),
-        ]
-    )
-
-    model_pipeline.fit(X, y)
+    from sklearn.linear_model import LogisticRegression, SGDClassifier
+
+    with open(dataset.path, "rb") as file:
+        is_arrow = file.read(6) == b"ARROW1"
+
+    if training_mode in ("batch", "search"):
+        if is_arrow:
+            # Arrow IPC file written by data_download: map it instead of parsing it
+            data = pa.ipc.open_file(pa.memory_map(dataset.path)).read_pandas()
+        else:
+            data = pd.read_csv(dataset.path)
+        X = data.drop(columns=["target"])
+        y = data["target"]
+
+        model_pipeline = Pipeline(
+            [
+                ("imputer", SimpleImputer(strategy="median")),
+                ("scaler", StandardScaler()),
+                ("clf", LogisticRegression(random_state=42)),
+            ]
+        )
+
+        if training_mode == "search":
+            from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+            from sklearn.model_selection import HalvingGridSearchCV
+            from sklearn.preprocessing import RobustScaler
+
+            # Every round fits the remaining candidates on all cores, each round
+            # on 3 times more rows, and only the best third of them continues
+            search = HalvingGridSearchCV(
+                model_pipeline,
+                {
+                    "imputer__strategy": ["median", "mean"],
+                    "scaler": [StandardScaler(), RobustScaler()],
+                    "clf__C": [0.01, 0.1, 1.0, 10.0],
+                    "clf__class_weight": [None, "balanced"],
+                },
+                factor=3,
+                scoring="roc_auc",
+                n_jobs=-1,
+                random_state=42,
+            )
+            search.fit(X, y)
+            model_pipeline = search.best_estimator_
+
+            def to_json(params):
+                return {
+                    name: (
+                        value
+                        if value is None or isinstance(value, (str, int, float))
+                        else repr(value)
+                    )
+                    for name, value in params.items()
+                }
+
+            results = search.cv_results_
+            model.metadata["search"] = {
+                "bestParams": to_json(search.best_params_),
+                "bestScore": float(search.best_score_),
+                "candidates": [
+                    {
+                        "iteration": int(results["iter"][i]),
+                        "samples": int(results["n_resources"][i]),
+                        "params": to_json(results["params"][i]),
+                        "meanTestScore": float(results["mean_test_score"][i]),
+                        "meanFitSeconds": float(results["mean_fit_time"][i]),
+                    }
+                    for i in range(len(results["params"]))
+                ],
+            }
+        else:
+            model_pipeline.fit(X, y)
+    elif training_mode == "streaming":
+        # Out-of-core: only one chunk of the training data is in memory at a time
+        chunk_size = 500_000
+        sample_size = 100_000
+        epochs = 5
+        rng = np.random.default_rng(42)
+
+        def read_chunks():
+            if is_arrow:
+                reader = pa.ipc.open_file(pa.memory_map(dataset.path))
+                for i in range(reader.num_record_batches):
+                    batch = reader.get_batch(i)
+                    for offset in range(0, batch.num_rows, chunk_size):
+                        yield batch.slice(offset, chunk_size).to_pandas()
+            else:
+                yield from pd.read_csv(dataset.path, chunksize=chunk_size)
+
+        # 1st pass: the imputer medians are estimated on a reservoir sample of rows
+        sample, seen = None, 0
+        for chunk in read_chunks():
+            X = chunk.drop(columns=["target"])
+            if sample is None:
+                columns = X.columns
+                sample = np.empty((sample_size, len(columns)))
+            values = X.to_numpy(dtype=np.float64)
+            filled = min(seen, sample_size)
+            fill = min(sample_size - filled, len(values))
+            sample[filled : filled + fill] = values[:fill]
+            # Row i replaces a random sample row with probability sample_size / (i + 1)
+            positions = rng.integers(0, seen + np.arange(fill, len(values)) + 1)
+            replace = positions < sample_size
+            sample[positions[replace]] = values[fill:][replace]
+            seen += len(values)
+        if sample is None:
+            raise ValueError(f"No training data in {dataset.path}")
+        imputer = SimpleImputer(strategy="median").fit(
+            pd.DataFrame(sample[: min(seen, sample_size)], columns=columns)
+        )
+
+        # 2nd pass: the scaler statistics are merged over all chunks
+        scaler = StandardScaler()
+        for chunk in read_chunks():
+            scaler.partial_fit(imputer.transform(chunk.drop(columns=["target"])))
+
+        # Then the classifier sees every chunk once per epoch, with shuffled rows
+        # as data_download writes the flights ordered by date
+        sklearn_version = tuple(int(v) for v in sklearn.__version__.split(".")[:2])
+        clf = SGDClassifier(
+            loss="log_loss" if sklearn_version >= (1, 1) else "log",
+            random_state=42,
+        )
+        for _ in range(epochs):
+            for chunk in read_chunks():
+                order = rng.permutation(len(chunk))
+                X = scaler.transform(imputer.transform(chunk.drop(columns=["target"])))
+                y = chunk["target"].to_numpy(dtype=bool)
+                clf.partial_fit(X[order], y[order], classes=[False, True])
+
+        # Same steps as in batch mode, so the model is used in the same way
+        model_pipeline = Pipeline(
+            [("imputer", imputer), ("scaler", scaler), ("clf", clf)]
+        )
+    elif training_mode == "distributed":
+        # Data-parallel: every worker process loads one shard of the rows and
+        # only sends statistics and gradients. The same protocol would work
+        # with one replica per shard.
+        import io
+        import multiprocessing
+        import os
+        import traceback
+        from scipy.optimize import minimize
+
+        def read_shard(index):
+            if is_arrow:
+                table = pa.ipc.open_file(pa.memory_map(dataset.path)).read_all()
+                start = table.num_rows * index // training_workers
+                end = table.num_rows * (index + 1) // training_workers
+                return table.slice(start, end - start).to_pandas()
+
+            # CSV: a shard holds the lines starting in its byte range
+            with open(dataset.path, "rb") as file:
+                header = file.readline()
+                size = os.path.getsize(dataset.path) - len(header)
+
+                def line_start(offset):
+                    if offset == 0:
+                        return len(header)
+                    file.seek(len(header) + offset - 1)
+                    file.readline()
+                    return file.tell()
+
+                start = line_start(size * index // training_workers)
+                end = line_start(size * (index + 1) // training_workers)
+                file.seek(start)
+                return pd.read_csv(io.BytesIO(header + file.read(end - start)))
+
+        def run_shard(connection, index):
+            data = read_shard(index)
+            X = data.drop(columns=["target"]).to_numpy(dtype=np.float64)
+            # Labels as -1 / 1
+            y = np.where(data["target"].to_numpy(dtype=bool), 1.0, -1.0)
+            del data
+
+            # Value counts can be merged into the exact medians
+            connection.send(
+                (
+                    "ok",
+                    [
+                        np.unique(column[~np.isnan(column)], return_counts=True)
+                        for column in X.T
+                    ],
+                )
+            )
+            X = np.where(np.isnan(X), connection.recv(), X)
+            # A CSV byte range can hold no line start, an empty shard adds nothing
+            mean = X.mean(axis=0) if len(X) else np.zeros(X.shape[1])
+            connection.send(("ok", (len(X), mean, ((X - mean) ** 2).sum(axis=0))))
+            mean, scale = connection.recv()
+            X = (X - mean) / scale
+
+            # Log loss and its gradient for the coefficients and intercept
+            while (params := connection.recv()) is not None:
+                margin = y * (X @ params[:-1] + params[-1])
+                gradient = -y / (1 + np.exp(margin))
+                connection.send(
+                    (
+                        "ok",
+                        (
+                            np.logaddexp(0, -margin).sum(),
+                            np.append(X.T @ gradient, gradient.sum()),
+                        ),
+                    )
+                )
+
+        def worker(connection, index):
+            # The forked worker inherits the parent's ends of the pipes, which
+            # would keep it from seeing the parent close them
+            for parent_connection in connections:
+                parent_connection.close()
+            try:
+                run_shard(connection, index)
+            except (EOFError, BrokenPipeError):
+                # The parent closed the connection after another worker failed
+                pass
+            except Exception:
+                connection.send(("error", traceback.format_exc()))
+
+        if is_arrow:
+            reader = pa.ipc.open_file(pa.memory_map(dataset.path))
+            names = reader.schema.names
+            num_rows = sum(
+                reader.get_batch(i).num_rows for i in range(reader.num_record_batches)
+            )
+        else:
+            names = pd.read_csv(dataset.path, nrows=0).columns
+            with open(dataset.path, "rb") as file:
+                num_rows = -1  # header row
+                while chunk := file.read(16 * 1024 * 1024):
+                    num_rows += chunk.count(b"\n")
+        columns = [name for name in names if name != "target"]
+        if num_rows <= 0:
+            raise ValueError(f"The training dataset {dataset.path} has no rows")
+        # More workers than rows would only add empty shards
+        training_workers = min(training_workers, num_rows)
+
+        context = multiprocessing.get_context("fork")
+        connections, processes = [], []
+        for index in range(training_workers):
+            connection, worker_connection = context.Pipe()
+            connections.append(connection)
+            process = context.Process(target=worker, args=(worker_connection, index))
+            process.start()
+            # Only the worker holds this end, so its exit shows up as EOFError
+            worker_connection.close()
+            processes.append(process)
+
+        def receive_all():
+            results = []
+            for index, connection in enumerate(connections):
+                try:
+                    status, result = connection.recv()
+                except EOFError:
+                    processes[index].join()
+                    raise RuntimeError(
+                        f"Training worker {index} exited with code "
+                        f"{processes[index].exitcode}"
+                    )
+                if status == "error":
+                    raise RuntimeError(f"Training worker {index} failed:\n{result}")
+                results.append(result)
+            return results
+
+        try:
+            value_counts = receive_all()
+            medians = []
+            for column_counts in zip(*value_counts):
+                values, counts = np.unique(
+                    np.concatenate([values for values, _ in column_counts]),
+                    return_inverse=True,
+                )
+                counts = np.bincount(
+                    counts,
+                    weights=np.concatenate([counts for _, counts in column_counts]),
+                )
+                # Same as np.median: the middle value, or the mean of the middle two
+                total = counts.sum()
+                positions = np.searchsorted(
+                    np.cumsum(counts), [(total - 1) // 2, total // 2], side="right"
+                )
+                medians.append(values[positions].mean())
+            medians = np.array(medians)
+            for connection in connections:
+                connection.send(medians)
+
+            # Means and variances of the shards are merged (Chan et al.)
+            stats = [shard_stats for shard_stats in receive_all() if shard_stats[0]]
+            num_samples = sum(n for n, _, _ in stats)
+            mean = sum(n * shard_mean for n, shard_mean, _ in stats) / num_samples
+            var = (
+                sum(
+                    squares + n * (shard_mean - mean) ** 2
+                    for n, shard_mean, squares in stats
+                )
+                / num_samples
+            )
+            if not (np.isfinite(mean).all() and np.isfinite(var).all()):
+                raise ValueError(
+                    f"The merged scaler statistics are not finite: mean {mean}, "
+                    f"variance {var}"
+                )
+            scale = np.where(var == 0, 1.0, np.sqrt(var))
+            for connection in connections:
+                connection.send((mean, scale))
+
+            # Same objective and L-BFGS settings as LogisticRegression(C=1.0)
+            def loss_and_gradient(params):
+                for connection in connections:
+                    connection.send(params)
+                results = receive_all()
+                loss = (
+                    sum(loss for loss, _ in results) + 0.5 * params[:-1] @ params[:-1]
+                )
+                gradient = sum(gradient for _, gradient in results)
+                gradient[:-1] += params[:-1]
+                return loss, gradient
+
+            result = minimize(
+                loss_and_gradient,
+                np.zeros(len(medians) + 1),
+                method="L-BFGS-B",
+                jac=True,
+                options={
+                    "maxiter": 100,
+                    "maxls": 50,
+                    "gtol": 1e-4,
+                    "ftol": 64 * np.finfo(float).eps,
+                },
+            )
+            for connection in connections:
+                connection.send(None)
+        finally:
+            # Workers waiting for a message stop when their connection is closed
+            for connection in connections:
+                connection.close()
+            for process in processes:
+                process.join(timeout=10)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+
+        # The steps are fitted on placeholder rows to be valid sklearn objects,
+        # then get the merged statistics and the optimized coefficients
+        imputer = SimpleImputer(strategy="median").fit(
+            pd.DataFrame([medians], columns=columns)
+        )
+        scaler = StandardScaler().fit(np.stack([mean - scale, mean + scale]))
+        scaler.mean_, scaler.var_, scaler.scale_ = mean, var, scale
+        scaler.n_samples_seen_ = num_samples
+        clf = LogisticRegression(random_state=42).fit(
+            np.zeros((2, len(columns))), [False, True]
+        )
+        clf.coef_ = result.x[np.newaxis, :-1]
+        clf.intercept_ = result.x[-1:]
+        clf.n_iter_ = np.array([result.nit])
+
+        model_pipeline = Pipeline(
+            [("imputer", imputer), ("scaler", scaler), ("clf", clf)]
+        )
+    else:
+        raise ValueError(f"Unknown training mode {training_mode}")
 
     model.metadata["framework"] = "scikit-learn"
     model.metadata["containerSpec"] = {
@@ -94,47 +501,129 @@ def model_train(
     with open(file_name, "wb") as file:
         pickle.dump(model_pipeline, file)
 
+    # Compact scoring artifact for fused_scorer.py: the scaler is folded into
+    # the weights and bias of the classifier, only the fill values remain
+    imputer, scaler, clf = (step for _, step in model_pipeline.steps)
+    if isinstance(scaler, StandardScaler):
+        offset = scaler.mean_ if scaler.with_mean else None
+    else:
+        offset = scaler.center_
+    num_features = len(imputer.statistics_)
+    offset = np.zeros(num_features) if offset is None else offset
+    scale = np.ones(num_features) if scaler.scale_ is None else scaler.scale_
+    weights = clf.coef_[0] / scale
+    np.savez(
+        model.path + "/model.npz",
+        fill_values=imputer.statistics_,
+        weights=weights,
+        bias=clf.intercept_[0] - weights @ offset,
+        classes=clf.classes_,
+    )
+
 
 @component(
     base_image="europe-docker.pkg.dev/vertex-ai/prediction/sklearn-cpu.1-0:latest",
+    packages_to_install=["pyarrow"],
 )
 def model_evaluate(
     test_set: Input[Dataset],
     model: Input[Model],
     metrics: Output[ClassificationMetrics],
 ):
+    import os
+    import numpy as np
     import pandas as pd
     import pickle
-    from sklearn.metrics import roc_curve, confusion_matrix, accuracy_score
+    import pyarrow as pa
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+    from sklearn.metrics import confusion_matrix
+
+    # The whole test set is scored in chunks, only their counts are kept
+    chunk_size = 100_000
+    num_bins = 1000
+    bins = np.linspace(0, 1, num_bins + 1)
+    workers = os.cpu_count() or 1
+
+    with open(test_set.path, "rb") as file:
+        is_arrow = file.read(6) == b"ARROW1"
+
+    def read_chunks():
+        if is_arrow:
+            # Arrow IPC file written by data_download: map it instead of parsing it
+            reader = pa.ipc.open_file(pa.memory_map(test_set.path))
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                for offset in range(0, batch.num_rows, chunk_size):
+                    yield batch.slice(offset, chunk_size).to_pandas()
+        else:
+            yield from pd.read_csv(test_set.path, chunksize=chunk_size)
 
-    data = pd.read_csv(test_set.path)[:1000]
     file_name = model.path + "/model.pkl"
     with open(file_name, "rb") as file:
         model_pipeline = pickle.load(file)
 
-    X = data.drop(columns=["target"])
-    y = data.target
-    y_pred = model_pipeline.predict(X)
-
-    y_scores = model_pipeline.predict_proba(X)[:, 1]
-    fpr, tpr, thresholds = roc_curve(y_true=y, y_score=y_scores, pos_label=True)
-    metrics.log_roc_curve(fpr.tolist(), tpr.tolist(), thresholds.tolist())
+    def evaluate_chunk(data):
+        X = data.drop(columns=["target"])
+        y = data["target"].to_numpy(dtype=bool)
+        y_scores = model_pipeline.predict_proba(X)[:, 1]
+        # Same as predict: the positive class is more likely
+        y_pred = y_scores > 0.5
+        return (
+            confusion_matrix(y, y_pred, labels=[False, True]),
+            np.histogram(y_scores[y], bins)[0],
+            np.histogram(y_scores[~y], bins)[0],
+        )
+
+    matrix = np.zeros((2, 2), dtype=np.int64)
+    positives = np.zeros(num_bins, dtype=np.int64)
+    negatives = np.zeros(num_bins, dtype=np.int64)
+
+    def merge(futures):
+        for future in futures:
+            chunk_matrix, chunk_positives, chunk_negatives = future.result()
+            matrix[:] += chunk_matrix
+            positives[:] += chunk_positives
+            negatives[:] += chunk_negatives
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        running = set()
+        for chunk in read_chunks():
+            # Bounds the number of chunks in memory
+            if len(running) >= 2 * workers:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                merge(done)
+            running.add(pool.submit(evaluate_chunk, chunk))
+        merge(wait(running)[0])
+
+    # ROC over the bin edges: scores in the bins at or above a threshold are
+    # positive. Empty bins don't change the curve and are left out
+    true_positives = np.concatenate([[0], np.cumsum(positives[::-1])])
+    false_positives = np.concatenate([[0], np.cumsum(negatives[::-1])])
+    thresholds = bins[::-1]
+    keep = np.concatenate([[True], (positives + negatives)[::-1] > 0])
+    tpr = true_positives[keep] / max(true_positives[-1], 1)
+    fpr = false_positives[keep] / max(false_positives[-1], 1)
+    metrics.log_roc_curve(fpr.tolist(), tpr.tolist(), thresholds[keep].tolist())
 
     metrics.log_confusion_matrix(
         ["False", "True"],
-        confusion_matrix(y, y_pred).tolist(),
+        matrix.tolist(),
     )
 
 
 # Define the workflow of the pipeline.
 @pipeline(name="gcp-mlops-v0", pipeline_root=pipeline_root_path)
 def pipeline(
-    training_data_url: str = f"gs://{BUCKET}/data/2021/2021-12.csv",
+    training_data_url: str = f"gs://{BUCKET}/data/parquet/year=2021/month=12",
     test_split_date: str = "2021-12-20",
+    dataset_format: str = "arrow",
+    training_mode: str = "batch",
+    training_workers: int = 4,
 ):
     data_op = data_download(
         data_url=training_data_url,
-        split_date=test_split_date
+        split_date=test_split_date,
+        dataset_format=dataset_format,
     )
 
     from google_cloud_pipeline_components.experimental.custom_job.utils import (
@@ -147,6 +636,8 @@ def pipeline(
 
     model_train_op = custom_job_distributed_training_op(
         dataset=data_op.outputs["dataset_train"],
+        training_mode=training_mode,
+        training_workers=training_workers,
         project=PROJECT_ID,
         location=REGION,
     )
@@ -179,14 +670,17 @@ def pipeline(
     )
 
 
-compiler.Compiler().compile(pipeline_func=pipeline, package_path="gcp-mlops-v0.json")
+if __name__ == "__main__":
+    compiler.Compiler().compile(
+        pipeline_func=pipeline, package_path="gcp-mlops-v0.json"
+    )
 
-aip.init(project=PROJECT_ID, staging_bucket=BUCKET, location=REGION)
+    aip.init(project=PROJECT_ID, staging_bucket=BUCKET, location=REGION)
 
-job = aip.PipelineJob(
-    display_name="gcp-mlops-v0",
-    template_path="gcp-mlops-v0.json",
-    pipeline_root=pipeline_root_path,
-)
+    job = aip.PipelineJob(
+        display_name="gcp-mlops-v0",
+        template_path="gcp-mlops-v0.json",
+        pipeline_root=pipeline_root_path,
+    )
 
-job.run(service_account=SERVICE_ACCOUNT)
+    job.run(service_account=SERVICE_ACCOUNT)
@@ -0,0 +1,168 @@
+"""Micro-benchmark of the coders for the Flight and AirportFeatures entities.
+
+Compares the registered `NamedTupleCoder` with the pickle based coders Beam
+falls back to for NamedTuples without a registered coder, and reports the
+encoded bytes per element, the encode/decode throughput and the CPU time per
+element. The plain `(airport_id, FlightStats)` tuples that the airport
+aggregation shuffles are compared with the same values as a NamedTuple, coded
+by `NamedTupleCoder` or Beam's `RowCoder`:
+
+    python benchmarks/coder_benchmark.py --elements 100000
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional, Tuple
+
+import apache_beam as beam
+
+from feature_pipeline.coders import NamedTupleCoder
+from feature_pipeline.entities import AirportFeatures, Flight, FlightStats
+
+
+class FlightStatsRecord(NamedTuple):
+    departure_delay_minutes: Optional[float]
+    taxi_out_minutes: Optional[float]
+    is_cancelled: bool
+
+
+def generate_flights(n, rng):
+    start = datetime(2021, 12, 1)
+    return [
+        Flight(
+            timestamp=start + timedelta(minutes=rng.randrange(31 * 24 * 60)),
+            flight_number=f"AA//{rng.randrange(1, 6000)}",
+            origin_airport_id=str(rng.randrange(10000, 16000)),
+            is_cancelled=rng.random() < 0.02,
+            departure_delay_minutes=float(rng.randrange(-20, 300)),
+            arrival_delay_minutes=float(rng.randrange(-40, 300)),
+            taxi_out_minutes=float(rng.randrange(5, 60)),
+            distance_miles=float(rng.randrange(50, 5000)),
+        )
+        for _ in range(n)
+    ]
+
+
+def generate_airport_features(n, rng):
+    start = datetime(2021, 12, 1)
+    return [
+        AirportFeatures(
+            timestamp=start + timedelta(hours=rng.randrange(31 * 24)),
+            origin_airport_id=str(rng.randrange(10000, 16000)),
+            average_departure_delay=rng.gauss(10, 20),
+            flight_count=rng.randrange(1, 500),
+            p50_departure_delay=float(rng.randrange(-10, 60)),
+            p90_departure_delay=float(rng.randrange(0, 200)),
+            average_taxi_out=rng.uniform(5, 40),
+            cancellation_rate=rng.random() / 10,
+        )
+        for _ in range(n)
+    ]
+
+
+def generate_keyed_flight_stats(flights, value_type=tuple):
+    return [
+        (
+            flight.origin_airport_id,
+            value_type(
+                (
+                    flight.departure_delay_minutes,
+                    flight.taxi_out_minutes,
+                    flight.is_cancelled,
+                )
+            ),
+        )
+        for flight in flights
+    ]
+
+
+def benchmark(coder, elements):
+    start, start_cpu = time.perf_counter(), time.process_time()
+    encoded = [coder.encode(element) for element in elements]
+    encode_seconds = time.perf_counter() - start
+    encode_cpu_seconds = time.process_time() - start_cpu
+
+    start, start_cpu = time.perf_counter(), time.process_time()
+    decoded = [coder.decode(element) for element in encoded]
+    decode_seconds = time.perf_counter() - start
+    decode_cpu_seconds = time.process_time() - start_cpu
+
+    assert decoded == elements, f"{coder} does not round trip"
+    return (
+        sum(len(element) for element in encoded) / len(elements),
+        len(elements) / encode_seconds,
+        len(elements) / decode_seconds,
+        (encode_cpu_seconds + decode_cpu_seconds) / len(elements) * 1e6,
+    )
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--elements", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    known_args = parser.parse_args(argv)
+
+    rng = random.Random(known_args.seed)
+    flights = generate_flights(known_args.elements, rng)
+    airport_features = generate_airport_features(known_args.elements, rng)
+    keyed_flight_stats = generate_keyed_flight_stats(flights)
+    keyed_flight_stats_records = generate_keyed_flight_stats(
+        flights, FlightStatsRecord._make
+    )
+    datasets = {
+        "Flight": (
+            flights,
+            {
+                "PickleCoder": beam.coders.PickleCoder(),
+                "FastPrimitivesCoder": beam.coders.FastPrimitivesCoder(),
+                "NamedTupleCoder": NamedTupleCoder(Flight),
+            },
+        ),
+        "AirportFeatures": (
+            airport_features,
+            {
+                "PickleCoder": beam.coders.PickleCoder(),
+                "FastPrimitivesCoder": beam.coders.FastPrimitivesCoder(),
+                "NamedTupleCoder": NamedTupleCoder(AirportFeatures),
+            },
+        ),
+        "(airport_id, FlightStats)": (
+            keyed_flight_stats,
+            {
+                # The coder Beam infers from the output type of key_by_airport
+                "FastPrimitivesCoder": beam.coders.registry.get_coder(
+                    Tuple[str, FlightStats]
+                ),
+            },
+        ),
+        "(airport_id, FlightStatsRecord)": (
+            keyed_flight_stats_records,
+            {
+                "NamedTupleCoder": beam.coders.TupleCoder(
+                    [beam.coders.StrUtf8Coder(), NamedTupleCoder(FlightStatsRecord)]
+                ),
+                "RowCoder": beam.coders.TupleCoder(
+                    [
+                        beam.coders.StrUtf8Coder(),
+                        beam.coders.RowCoder.from_type_hint(FlightStatsRecord, None),
+                    ]
+                ),
+            },
+        ),
+    }
+
+    for name, (elements, coders) in datasets.items():
+        print(name)
+        for coder_name, coder in coders.items():
+            size, encode_rate, decode_rate, cpu_micros = benchmark(coder, elements)
+            print(
+                f"  {coder_name:<20} {size:6.1f} bytes/element  "
+                f"encode {encode_rate:10,.0f}/s  decode {decode_rate:10,.0f}/s  "
+                f"cpu {cpu_micros:5.2f}µs/element"
+            )
+
+
+if __name__ == "__main__":
+    run()
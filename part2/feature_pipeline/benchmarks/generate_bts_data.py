@@ -0,0 +1,172 @@
+"""Generates synthetic BTS on-time performance data for benchmarks.
+
+The files have the full `csv_headers` layout of the monthly BTS downloads.
+Departures are spread over the airports with a Zipf distribution, so that a
+few hub airports hold most of the flights:
+
+    python benchmarks/generate_bts_data.py --rows 1000000 \
+        --output data/synthetic/2021/2021-12.csv
+"""
+
+import argparse
+import calendar
+import time
+from pathlib import Path
+
+import numpy as np
+
+from feature_pipeline.helpers import csv_headers
+
+AIRLINES = ["WN", "DL", "AA", "UA", "OO", "YX", "B6", "MQ", "AS", "NK", "9E", "F9"]
+AIRLINE_WEIGHTS = [17, 14, 14, 10, 10, 5, 5, 5, 5, 5, 5, 5]
+
+COLUMN = {name: i for i, name in enumerate(csv_headers)}
+
+
+def airport_codes(num_airports):
+    letters = np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+    indices = np.arange(num_airports)
+    return [
+        "".join(code)
+        for code in zip(
+            letters[indices // 676 % 26],
+            letters[indices // 26 % 26],
+            letters[indices % 26],
+        )
+    ]
+
+
+def format_clock(minutes):
+    """Formats minutes since midnight as the BTS `hhmm` clock time."""
+    minutes = minutes % (24 * 60)
+    return [f"{m // 60:02}{m % 60:02}" for m in minutes.tolist()]
+
+
+def generate_chunk(rng, rows, year, month, num_airports, skew):
+    days_in_month = calendar.monthrange(year, month)[1]
+
+    weights = 1 / np.arange(1, num_airports + 1) ** skew
+    weights /= weights.sum()
+    origin = rng.choice(num_airports, size=rows, p=weights)
+    dest = (origin + rng.integers(1, num_airports, size=rows)) % num_airports
+    codes = airport_codes(num_airports)
+
+    day = rng.integers(1, days_in_month + 1, size=rows)
+    airline = rng.choice(len(AIRLINES), size=rows, p=np.array(AIRLINE_WEIGHTS) / 100)
+    flight_number = rng.integers(1, 7000, size=rows)
+
+    scheduled_departure = rng.integers(5 * 60, 23 * 60 + 30, size=rows)
+    # Most flights leave roughly on time, some have long delays
+    departure_delay = np.where(
+        rng.random(rows) < 0.8,
+        rng.normal(-3, 6, size=rows),
+        rng.exponential(45, size=rows),
+    ).round()
+    taxi_out = rng.gamma(4, 4, size=rows).round() + 1
+    distance = rng.integers(70, 3000, size=rows)
+    arrival_delay = (departure_delay + rng.normal(-5, 12, size=rows)).round()
+
+    cancelled = rng.random(rows) < 0.02
+    diverted = ~cancelled & (rng.random(rows) < 0.003)
+
+    departure_time = scheduled_departure + departure_delay.astype(np.int64)
+    wheels_off = format_clock(departure_time + taxi_out.astype(np.int64))
+    scheduled = format_clock(scheduled_departure)
+    departure_clock = format_clock(departure_time)
+
+    lines = []
+    row = [""] * len(csv_headers)
+    row[COLUMN["Year"]] = str(year)
+    row[COLUMN["Quarter"]] = str((month - 1) // 3 + 1)
+    row[COLUMN["Month"]] = str(month)
+    row[COLUMN["Flights"]] = "1.00"
+    for i in range(rows):
+        o, d = origin[i], dest[i]
+        row[COLUMN["DayofMonth"]] = str(day[i])
+        row[COLUMN["DayOfWeek"]] = str(calendar.weekday(year, month, day[i]) + 1)
+        row[COLUMN["FlightDate"]] = f"{year}-{month:02}-{day[i]:02}"
+        row[COLUMN["Reporting_Airline"]] = f'"{AIRLINES[airline[i]]}"'
+        row[COLUMN["Flight_Number_Reporting_Airline"]] = str(flight_number[i])
+        row[COLUMN["OriginAirportID"]] = str(10000 + o)
+        row[COLUMN["Origin"]] = f'"{codes[o]}"'
+        row[COLUMN["OriginCityName"]] = f'"City {codes[o]}, ST"'
+        row[COLUMN["DestAirportID"]] = str(10000 + d)
+        row[COLUMN["Dest"]] = f'"{codes[d]}"'
+        row[COLUMN["DestCityName"]] = f'"City {codes[d]}, ST"'
+        row[COLUMN["CRSDepTime"]] = f'"{scheduled[i]}"'
+        row[COLUMN["Distance"]] = f"{distance[i]}.00"
+        row[COLUMN["Cancelled"]] = "1.00" if cancelled[i] else "0.00"
+        row[COLUMN["CancellationCode"]] = '"B"' if cancelled[i] else ""
+        row[COLUMN["Diverted"]] = "1.00" if diverted[i] else "0.00"
+
+        if cancelled[i]:
+            values = ("", "", "", "", "")
+        else:
+            values = (
+                f'"{departure_clock[i]}"',
+                f"{departure_delay[i]:.2f}",
+                f"{taxi_out[i]:.2f}",
+                f'"{wheels_off[i]}"',
+                "" if diverted[i] else f"{arrival_delay[i]:.2f}",
+            )
+        (
+            row[COLUMN["DepTime"]],
+            row[COLUMN["DepDelay"]],
+            row[COLUMN["TaxiOut"]],
+            row[COLUMN["WheelsOff"]],
+            row[COLUMN["ArrDelay"]],
+        ) = values
+
+        # BTS rows end with a trailing comma
+        lines.append(",".join(row) + ",\n")
+
+    return "".join(lines)
+
+
+def generate(output, rows, year, month, num_airports, skew, seed, chunk_rows):
+    rng = np.random.default_rng(seed)
+    output.parent.mkdir(exist_ok=True, parents=True)
+
+    with open(output, "w") as file:
+        file.write(",".join(f'"{name}"' for name in csv_headers) + ",\n")
+        for start in range(0, rows, chunk_rows):
+            file.write(
+                generate_chunk(
+                    rng, min(chunk_rows, rows - start), year, month, num_airports, skew
+                )
+            )
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--output", type=Path, required=True)
+    parser.add_argument("--year", type=int, default=2021)
+    parser.add_argument("--month", type=int, default=12)
+    parser.add_argument("--airports", type=int, default=350)
+    parser.add_argument(
+        "--skew", type=float, default=1.2, help="Zipf exponent of the airport sizes."
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-rows", dest="chunk_rows", type=int, default=100_000)
+    known_args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    generate(
+        known_args.output,
+        known_args.rows,
+        known_args.year,
+        known_args.month,
+        known_args.airports,
+        known_args.skew,
+        known_args.seed,
+        known_args.chunk_rows,
+    )
+    print(
+        f"Wrote {known_args.rows:,} rows to {known_args.output} "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,166 @@
+"""Benchmark harness for the stages of the batch feature pipeline.
+
+Runs the pipeline up to each stage on the DirectRunner and reports the wall
+time, the peak RSS and the bytes written. The runs are cumulative: `parse`
+reads and parses, `aggregate` reads, parses and aggregates. The time of a
+stage on its own is reported as the difference to the run of the previous
+stage, together with the rows per second it processes. Every run has its own
+process, so the peak RSS is measured per run. Extra arguments are passed
+on to Beam, e.g. to run on several processes:
+
+    python benchmarks/generate_bts_data.py --rows 1000000 --output /tmp/bts/2021-12.csv
+    python benchmarks/run_benchmark.py --input /tmp/bts/2021-12.csv --parse-mode batch \
+        --direct_num_workers 4 --direct_running_mode multi_processing
+"""
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import apache_beam as beam
+from apache_beam.io.filesystems import FileSystems
+from apache_beam.options.pipeline_options import PipelineOptions
+
+from feature_pipeline.aggregations import AggregateAirportFeatures
+from feature_pipeline.batch_feature_pipeline import ParseFlights
+from feature_pipeline.batch_feature_pipeline import run as run_feature_pipeline
+
+STAGES = ["read", "parse", "aggregate", "full"]
+
+
+def count_rows(file_pattern):
+    rows = 0
+    for match in FileSystems.match([file_pattern]):
+        for metadata in match.metadata_list:
+            with FileSystems.open(metadata.path) as file:
+                while chunk := file.read(16 * 1024 * 1024):
+                    rows += chunk.count(b"\n")
+            rows -= 1  # header row
+    return rows
+
+
+def output_bytes(directory):
+    return sum(
+        metadata.size_in_bytes
+        for match in FileSystems.match([f"{directory}/**"])
+        for metadata in match.metadata_list
+    )
+
+
+def run_stage(stage, known_args, pipeline_args):
+    """Runs the pipeline up to `stage` and returns the number of written bytes."""
+    if stage == "full":
+        with tempfile.TemporaryDirectory() as output_dir:
+            for output in ("airports", "flights", "read_instances"):
+                Path(output_dir, output).mkdir()
+            run_feature_pipeline(
+                [
+                    f"--input={known_args.input}",
+                    f"--output-airports={output_dir}/airports/",
+                    f"--output-flights={output_dir}/flights/",
+                    f"--output-read-instances={output_dir}/read_instances/",
+                    f"--parse-mode={known_args.parse_mode}",
+                    f"--output-format={known_args.output_format}",
+                    *(["--pre-aggregate-windows"] if known_args.pre_aggregate else []),
+                    *pipeline_args,
+                ]
+            )
+            return output_bytes(output_dir)
+
+    with beam.Pipeline(options=PipelineOptions(pipeline_args)) as pipeline:
+        output = pipeline | "read_input" >> beam.io.ReadFromText(known_args.input)
+        if stage in ("parse", "aggregate"):
+            output = output | "parse_flights" >> ParseFlights(known_args.parse_mode)
+        if stage == "aggregate":
+            output = output | "aggregate_airports" >> AggregateAirportFeatures(
+                pre_aggregate=known_args.pre_aggregate
+            )
+        output | "count" >> beam.combiners.Count.Globally().without_defaults()
+    return 0
+
+
+def measure_stage(stage, known_args, pipeline_args):
+    """Runs a stage and prints its wall time, peak RSS and output bytes as JSON."""
+    start = time.perf_counter()
+    written = run_stage(stage, known_args, pipeline_args)
+    seconds = time.perf_counter() - start
+
+    # ru_maxrss is in KiB on Linux, workers of the multi-processing runner are children
+    peak_rss = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    print(
+        json.dumps(
+            {"seconds": seconds, "peak_rss_mb": peak_rss / 1024, "bytes": written}
+        )
+    )
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", required=True, help="BTS CSV file(s) to process.")
+    parser.add_argument(
+        "--stages", default=",".join(STAGES), help="Comma-separated stages to run."
+    )
+    parser.add_argument(
+        "--parse-mode", dest="parse_mode", choices=["line", "batch"], default="line"
+    )
+    parser.add_argument(
+        "--output-format",
+        dest="output_format",
+        choices=["avro", "parquet"],
+        default="avro",
+    )
+    parser.add_argument("--pre-aggregate", dest="pre_aggregate", action="store_true")
+    parser.add_argument("--measure-stage", dest="measure_stage", help=argparse.SUPPRESS)
+    argv = sys.argv[1:] if argv is None else argv
+    known_args, pipeline_args = parser.parse_known_args(argv)
+
+    if known_args.measure_stage:
+        measure_stage(known_args.measure_stage, known_args, pipeline_args)
+        return
+
+    rows = count_rows(known_args.input)
+    print(f"{rows:,} rows in {known_args.input}")
+    print(
+        f"{'stage':<10} {'cumulative':>11} {'stage':>9} {'stage rows/s':>13} "
+        f"{'peak RSS':>10} {'output':>12}"
+    )
+    stages = known_args.stages.split(",")
+    metrics = {}
+    for stage in stages:
+        result = subprocess.run(
+            [sys.executable, __file__, "--measure-stage", stage, *argv],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        metrics[stage] = json.loads(result.stdout.strip().splitlines()[-1])
+
+    for stage in stages:
+        seconds = metrics[stage]["seconds"]
+        # The difference to the previous stage, if it was run too
+        index = STAGES.index(stage)
+        previous = metrics.get(STAGES[index - 1]) if index > 0 else {"seconds": 0.0}
+        if previous is None:
+            stage_columns = f"{'-':>9} {'-':>13}"
+        else:
+            stage_seconds = seconds - previous["seconds"]
+            stage_columns = (
+                f"{stage_seconds:9.1f} {rows / max(stage_seconds, 1e-9):13,.0f}"
+            )
+        print(
+            f"{stage:<10} {seconds:11.1f} {stage_columns} "
+            f"{metrics[stage]['peak_rss_mb']:8.0f}MB "
+            f"{metrics[stage]['bytes'] / 1024**2:10.1f}MB"
+        )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,218 @@
+"""Benchmark of the airport aggregation on synthetic, skewed flight data.
+
+A handful of hub airports receive most of the flights (Zipf distributed), which
+makes the workers owning these keys the stragglers of the `group_by_airport`
+step. The flights are generated and written to Avro files once, before any
+run is timed. Every run reads them back and aggregates them on several worker
+processes, with and without hot key fan-out.
+
+The combine steps are timed per call and reported as Beam metrics. `add` is
+the time of adding the flights of one key in one bundle to an accumulator,
+`merge` the time of merging the accumulators of one key. Their maxima are the
+work of the straggling key. The wall time of a run that only reads the flights
+is subtracted from the aggregation runs as well:
+
+    python benchmarks/skewed_aggregation.py --flights 2000000 --fanout 8 \
+        --direct_num_workers 4 --direct_running_mode multi_processing
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+
+import apache_beam as beam
+from apache_beam.metrics.metric import Metrics, MetricsFilter
+from apache_beam.options.pipeline_options import PipelineOptions
+
+from feature_pipeline.aggregations import AggregateAirportFeatures
+from feature_pipeline.combiners import AirportStatsCombineFn
+from feature_pipeline.entities import flight_avro_schema
+
+
+def generate_flights(shard, flights_per_shard, num_airports, skew):
+    import random
+    from datetime import datetime, timedelta
+    from apache_beam.utils.timestamp import Timestamp
+    from feature_pipeline.entities import Flight
+
+    rng = random.Random(shard)
+    weights = [1 / (rank**skew) for rank in range(1, num_airports + 1)]
+    airports = rng.choices(range(num_airports), weights=weights, k=flights_per_shard)
+    start = datetime(2021, 12, 1)
+
+    for i, airport in enumerate(airports):
+        timestamp = start + timedelta(minutes=rng.randrange(31 * 24 * 60))
+        flight = Flight(
+            timestamp=timestamp,
+            flight_number=f"XX//{shard}-{i}",
+            origin_airport_id=str(10000 + airport),
+            is_cancelled=False,
+            departure_delay_minutes=rng.gauss(10, 30),
+            arrival_delay_minutes=rng.gauss(10, 30),
+            taxi_out_minutes=rng.uniform(5, 40),
+            distance_miles=rng.uniform(100, 3000),
+        )
+        yield beam.window.TimestampedValue(
+            flight, Timestamp.from_rfc3339(timestamp.isoformat())
+        )
+
+
+def write_flights(known_args, pipeline_args, file_path_prefix):
+    shards = known_args.shards
+    flights_per_shard = known_args.flights // shards
+
+    with beam.Pipeline(options=PipelineOptions(pipeline_args)) as pipeline:
+        (
+            pipeline
+            | "shards" >> beam.Create(range(shards))
+            | "reshuffle" >> beam.Reshuffle()
+            | "generate_flights"
+            >> beam.FlatMap(
+                generate_flights,
+                flights_per_shard,
+                known_args.airports,
+                known_args.skew,
+            )
+            | "to_records" >> beam.Map(lambda flight: flight._asdict())
+            | "write_flights"
+            >> beam.io.WriteToAvro(file_path_prefix, schema=flight_avro_schema)
+        )
+
+
+def to_timestamped_flight(record):
+    from apache_beam.utils.timestamp import Timestamp
+    from feature_pipeline.entities import Flight
+
+    flight = Flight(**record)
+    return beam.window.TimestampedValue(
+        flight, Timestamp.from_utc_datetime(flight.timestamp)
+    )
+
+
+class TimedCombineFn(beam.CombineFn):
+    """Runs a CombineFn and records the time of its steps as Beam metrics in µs."""
+
+    def __init__(self, combine_fn):
+        self.combine_fn = combine_fn
+
+    @staticmethod
+    def record(name, seconds):
+        Metrics.distribution("skewed_aggregation", name).update(int(seconds * 1e6))
+
+    def create_accumulator(self):
+        # The inner accumulator and the time spent adding inputs to it
+        return [self.combine_fn.create_accumulator(), 0.0]
+
+    def add_input(self, accumulator, element):
+        start = time.perf_counter()
+        accumulator[0] = self.combine_fn.add_input(accumulator[0], element)
+        accumulator[1] += time.perf_counter() - start
+        return accumulator
+
+    def merge_accumulators(self, accumulators):
+        start = time.perf_counter()
+        accumulators = list(accumulators)
+        merged = self.combine_fn.merge_accumulators(
+            [accumulator for accumulator, _ in accumulators]
+        )
+        self.record("merge", time.perf_counter() - start)
+        for _, add_seconds in accumulators:
+            if add_seconds:
+                self.record("add", add_seconds)
+        return [merged, 0.0]
+
+    def compact(self, accumulator):
+        return [self.combine_fn.compact(accumulator[0]), accumulator[1]]
+
+    def extract_output(self, accumulator):
+        if accumulator[1]:
+            self.record("add", accumulator[1])
+        return self.combine_fn.extract_output(accumulator[0])
+
+
+def run_pipeline(pipeline_args, file_pattern, aggregation=None):
+    """Returns the wall time and the combine metrics of a run.
+
+    The run reads the flights and applies `aggregation`, if given.
+    """
+    start = time.perf_counter()
+    pipeline = beam.Pipeline(options=PipelineOptions(pipeline_args))
+    output = (
+        pipeline
+        | "read_flights" >> beam.io.ReadFromAvro(file_pattern)
+        | "to_flights" >> beam.Map(to_timestamped_flight)
+    )
+    if aggregation is not None:
+        output = output | "aggregate_airports" >> aggregation
+    output | "count" >> beam.combiners.Count.Globally().without_defaults()
+    result = pipeline.run()
+    result.wait_until_finish()
+    seconds = time.perf_counter() - start
+
+    # Maximum of each metric over all steps that record it
+    metrics = {}
+    for metric in result.metrics().query(
+        MetricsFilter().with_namespace("skewed_aggregation")
+    )["distributions"]:
+        name = metric.key.metric.name
+        metrics[name] = max(metrics.get(name, 0), metric.committed.max or 0)
+    return seconds, metrics
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--flights", type=int, default=200_000)
+    parser.add_argument("--airports", type=int, default=350)
+    parser.add_argument(
+        "--skew", type=float, default=1.2, help="Zipf exponent of the airport sizes."
+    )
+    parser.add_argument("--shards", type=int, default=32)
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument("--pre-aggregate", dest="pre_aggregate", action="store_true")
+    parser.add_argument("--repeats", type=int, default=3)
+    known_args, pipeline_args = parser.parse_known_args(argv)
+    if not any(arg.startswith("--direct_num_workers") for arg in pipeline_args):
+        # Hot keys only straggle if other keys run in parallel
+        pipeline_args += [
+            "--direct_num_workers=4",
+            "--direct_running_mode=multi_processing",
+        ]
+
+    with tempfile.TemporaryDirectory() as input_dir:
+        write_flights(known_args, pipeline_args, f"{input_dir}/flights")
+        file_pattern = f"{input_dir}/flights*"
+
+        read_durations = [
+            run_pipeline(pipeline_args, file_pattern)[0]
+            for _ in range(known_args.repeats)
+        ]
+        read_seconds = statistics.median(read_durations)
+        print(
+            f"read only  median={read_seconds:.2f}s "
+            f"runs={[round(d, 2) for d in read_durations]}"
+        )
+
+        for fanout in (0, known_args.fanout):
+            aggregation = AggregateAirportFeatures(
+                pre_aggregate=known_args.pre_aggregate,
+                hot_key_fanout=fanout,
+                combine_fn=TimedCombineFn(AirportStatsCombineFn()),
+            )
+            runs = [
+                run_pipeline(pipeline_args, file_pattern, aggregation)
+                for _ in range(known_args.repeats)
+            ]
+            seconds = statistics.median(duration for duration, _ in runs)
+            max_add_ms = statistics.median(m.get("add", 0) for _, m in runs) / 1e3
+            max_merge_ms = statistics.median(m.get("merge", 0) for _, m in runs) / 1e3
+            print(
+                f"fanout={fanout:<3} median={seconds:.2f}s "
+                f"aggregation={seconds - read_seconds:.2f}s "
+                f"max add={max_add_ms:.1f}ms max merge={max_merge_ms:.1f}ms "
+                f"runs={[round(duration, 2) for duration, _ in runs]}"
+            )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,150 @@
+from typing import Tuple
+
+import apache_beam as beam
+
+from feature_pipeline.combiners import AirportStatsCombineFn
+from feature_pipeline.entities import FlightStats
+
+
+class PartialCombineFn(beam.CombineFn):
+    """Runs a CombineFn but outputs its accumulator instead of the final value.
+
+    Used together with `MergePartialsCombineFn` to aggregate in two steps.
+    """
+
+    def __init__(self, combine_fn):
+        self.combine_fn = combine_fn
+
+    def create_accumulator(self):
+        return self.combine_fn.create_accumulator()
+
+    def add_input(self, accumulator, element):
+        return self.combine_fn.add_input(accumulator, element)
+
+    def merge_accumulators(self, accumulators):
+        return self.combine_fn.merge_accumulators(accumulators)
+
+    def extract_output(self, accumulator):
+        return self.combine_fn.compact(accumulator)
+
+
+class MergePartialsCombineFn(beam.CombineFn):
+    """Merges accumulators produced by `PartialCombineFn` into the final value."""
+
+    def __init__(self, combine_fn):
+        self.combine_fn = combine_fn
+
+    def create_accumulator(self):
+        return self.combine_fn.create_accumulator()
+
+    def add_input(self, accumulator, partial):
+        return self.combine_fn.merge_accumulators([accumulator, partial])
+
+    def merge_accumulators(self, accumulators):
+        return self.combine_fn.merge_accumulators(accumulators)
+
+    def extract_output(self, accumulator):
+        return self.combine_fn.extract_output(accumulator)
+
+
+class AggregateAirportFeatures(beam.PTransform):
+    """Computes the airport features over sliding windows.
+
+    Outputs `(origin_airport_id, features)` pairs in sliding windows of
+    `window_size` seconds, starting every `window_period` seconds, where
+    `features` is the dict returned by `AirportStatsCombineFn`.
+
+    With `pre_aggregate=True` the flights are first combined into one partial
+    per airport and period. The sliding windows are then built from these
+    partials, so every flight is shuffled once instead of once per window.
+
+    With `hot_key_fanout > 1` the per-airport combine runs in two stages: the
+    values of a key are first combined on `hot_key_fanout` intermediate keys,
+    so a few hub airports don't end up on a single worker. If `hot_keys` is
+    given, only these airports are fanned out.
+
+    `trigger`, `accumulation_mode` and `allowed_lateness` are passed on to the
+    sliding windows, e.g. to emit early and late results in streaming mode.
+    `combine_fn` replaces `AirportStatsCombineFn`, e.g. to instrument it.
+    """
+
+    def __init__(
+        self,
+        window_size=4 * 60 * 60,
+        window_period=60 * 60,
+        pre_aggregate=False,
+        hot_key_fanout=0,
+        hot_keys=None,
+        trigger=None,
+        accumulation_mode=None,
+        allowed_lateness=0,
+        combine_fn=None,
+    ):
+        super().__init__()
+        if window_size % window_period != 0:
+            raise ValueError(
+                f"Window size ({window_size}s) must be a multiple of the window period ({window_period}s)"
+            )
+        if pre_aggregate and trigger is not None:
+            raise ValueError("Pre-aggregated windows don't support custom triggers")
+        self.window_size = window_size
+        self.window_period = window_period
+        self.pre_aggregate = pre_aggregate
+        self.hot_key_fanout = hot_key_fanout
+        self.hot_keys = frozenset(hot_keys) if hot_keys else None
+        self.trigger = trigger
+        self.accumulation_mode = accumulation_mode
+        self.allowed_lateness = allowed_lateness
+        self.combine_fn = combine_fn or AirportStatsCombineFn()
+
+    def _combine_per_key(self, combine_fn):
+        combine = beam.CombinePerKey(combine_fn)
+        if self.hot_key_fanout <= 1:
+            return combine
+        if self.hot_keys is None:
+            return combine.with_hot_key_fanout(self.hot_key_fanout)
+
+        hot_keys, fanout = self.hot_keys, self.hot_key_fanout
+        return combine.with_hot_key_fanout(lambda key: fanout if key in hot_keys else 1)
+
+    def expand(self, flights):
+        # Typed, so that the shuffled values use the FastPrimitivesCoder
+        airport_flights = flights | "key_by_airport" >> beam.Map(
+            lambda flight: (
+                flight.origin_airport_id,
+                (
+                    flight.departure_delay_minutes,
+                    flight.taxi_out_minutes,
+                    flight.is_cancelled,
+                ),
+            )
+        ).with_output_types(Tuple[str, FlightStats])
+
+        if not self.pre_aggregate:
+            return (
+                airport_flights
+                | "window"
+                >> beam.WindowInto(
+                    beam.window.SlidingWindows(self.window_size, self.window_period),
+                    trigger=self.trigger,
+                    accumulation_mode=self.accumulation_mode,
+                    allowed_lateness=self.allowed_lateness,
+                )
+                | "group_by_airport" >> self._combine_per_key(self.combine_fn)
+            )
+
+        # Partials are emitted at the end of their period, so each one falls
+        # into exactly the sliding windows that contain its flights.
+        return (
+            airport_flights
+            | "window_periods"
+            >> beam.WindowInto(beam.window.FixedWindows(self.window_period))
+            | "pre_aggregate_by_airport"
+            >> self._combine_per_key(PartialCombineFn(self.combine_fn))
+            | "window"
+            >> beam.WindowInto(
+                beam.window.SlidingWindows(self.window_size, self.window_period)
+            )
+            | "group_by_airport"
+            >> self._combine_per_key(MergePartialsCombineFn(self.combine_fn))
+        )
@@ -1,10 +1,28 @@
 import argparse
+import logging
 
 import apache_beam as beam
 from apache_beam.options.pipeline_options import PipelineOptions
 from apache_beam.options.pipeline_options import SetupOptions
 
-from feature_pipeline.entities import Flight, flight_avro_schema, airport_avro_schema
+from feature_pipeline.aggregations import AggregateAirportFeatures
+from feature_pipeline.entities import (
+    Flight,
+    ReadInstance,
+    airport_avro_schema,
+    airport_parquet_schema,
+    flight_avro_schema,
+    flight_parquet_schema,
+    read_instance_parquet_schema,
+)
+from feature_pipeline.incremental import (
+    KeepPartitionWindowsFn,
+    PartitionBounds,
+    is_carried_over,
+    load_manifest,
+    plan_partitions,
+    save_manifest,
+)
 
 
 def parse_csv(line: str):
@@ -12,6 +30,10 @@ def parse_csv(line: str):
     return next(csv.reader([line]))
 
 
+def optional_float(value: str):
+    return float(value) if value != "" else None
+
+
 def parse_line(fields):
     from datetime import datetime
     from apache_beam.utils.timestamp import Timestamp
@@ -20,29 +42,40 @@ def parse_line(fields):
 
     data = dict(zip(csv_headers, fields))
 
+    # Cancelled flights never take off, they are timed by their scheduled departure
+    departure_time = data["WheelsOff"]
+    if departure_time == "":
+        departure_time = data["CRSDepTime"]
+
     if (
         data["Year"] != "Year"  # skip header row
-        and len(data["WheelsOff"]) == 4  #
+        and len(departure_time) == 4  #
         and len(data["FlightDate"]) == 10  # row has a flight date
         and data["Distance"] != ""
     ):
-        wheels_off_hour = data["WheelsOff"][:2]
-        wheels_off_minutes = data["WheelsOff"][2:]
+        departure_hour = departure_time[:2]
+        departure_minutes = departure_time[2:]
         departure_date_time = (
-            f"{data['FlightDate']}T{wheels_off_hour}:{wheels_off_minutes}:00"
+            f"{data['FlightDate']}T{departure_hour}:{departure_minutes}:00"
         )
 
-        cancelled = (float(data["Cancelled"]) > 0) or (float(data["Diverted"]) > 0)
-
         try:
+            cancelled = (float(data["Cancelled"]) > 0) or (float(data["Diverted"]) > 0)
+            departure_delay = optional_float(data["DepDelay"])
+            arrival_delay = optional_float(data["ArrDelay"])
+            taxi_out = optional_float(data["TaxiOut"])
+            # Only cancelled and diverted flights may lack delays
+            if not cancelled and None in (departure_delay, arrival_delay, taxi_out):
+                return
+
             flight = Flight(
                 timestamp=datetime.fromisoformat(departure_date_time),
                 origin_airport_id=str(data["OriginAirportID"]),
                 flight_number=f"{data['Reporting_Airline']}//{data['Flight_Number_Reporting_Airline']}",
                 is_cancelled=cancelled,
-                departure_delay_minutes=float(data["DepDelay"]),
-                arrival_delay_minutes=float(data["ArrDelay"]),
-                taxi_out_minutes=float(data["TaxiOut"]),
+                departure_delay_minutes=departure_delay,
+                arrival_delay_minutes=arrival_delay,
+                taxi_out_minutes=taxi_out,
                 distance_miles=float(data["Distance"]),
             )
 
@@ -53,16 +86,307 @@ def parse_line(fields):
             pass
 
 
+def parse_float_column(values):
+    """Converts a column of CSV strings to floats, returning the values and a validity mask."""
+    import numpy as np
+
+    column = np.asarray(values)
+    parsed = np.full(len(column), np.nan)
+    valid = column != ""
+    try:
+        parsed[valid] = column[valid].astype(np.float64)
+    except ValueError:
+        # Fall back to element-wise parsing if the column contains malformed values
+        for i in np.flatnonzero(valid):
+            try:
+                parsed[i] = float(column[i])
+            except ValueError:
+                valid[i] = False
+    return parsed, valid
+
+
+def parse_departure_column(flight_dates, wheels_off):
+    """Combines FlightDate and WheelsOff (HHMM) columns into datetime64[us] departure times."""
+    import numpy as np
+
+    valid = (
+        (np.char.str_len(flight_dates) == 10)
+        & (flight_dates != "FlightDate")  # skip header row
+        & (np.char.str_len(wheels_off) == 4)
+        & np.char.isdigit(wheels_off)
+    )
+
+    clock = np.where(valid, wheels_off, "0").astype(np.int64)
+    hours, minutes = clock // 100, clock % 100
+    valid &= (hours < 24) & (minutes < 60)
+
+    dates = np.where(valid, flight_dates, "1970-01-01")
+    try:
+        days = dates.astype("datetime64[D]")
+    except ValueError:
+        days = np.empty(len(dates), dtype="datetime64[D]")
+        for i, date in enumerate(dates):
+            try:
+                days[i] = np.datetime64(date, "D")
+            except ValueError:
+                days[i] = np.datetime64("1970-01-01")
+                valid[i] = False
+
+    departures = days.astype("datetime64[m]") + (hours * 60 + minutes).astype(
+        "timedelta64[m]"
+    )
+    return departures.astype("datetime64[us]"), valid
+
+
+def parse_departure_times(flight_dates, wheels_off, scheduled_departures):
+    """Departure times from WheelsOff, or from CRSDepTime for flights that never took off.
+
+    Like `parse_line`, only an empty WheelsOff falls back to CRSDepTime, rows
+    with a malformed WheelsOff (e.g. "2400") are dropped.
+    """
+    import numpy as np
+
+    departures, valid = parse_departure_column(flight_dates, wheels_off)
+    scheduled, scheduled_valid = parse_departure_column(
+        flight_dates, scheduled_departures
+    )
+    never_took_off = wheels_off == ""
+    return (
+        np.where(never_took_off, scheduled, departures),
+        np.where(never_took_off, scheduled_valid, valid),
+    )
+
+
+class ParseFlightBatchFn(beam.DoFn):
+    """Parses a batch of CSV lines into Flight records.
+
+    Only the columns in `flight_csv_columns` are kept and the filters and type
+    conversions of `parse_line` are applied to whole columns at once.
+    """
+
+    def setup(self):
+        from operator import itemgetter
+        from feature_pipeline.helpers import csv_headers, flight_csv_columns
+
+        indices = [csv_headers.index(column) for column in flight_csv_columns]
+        self._project = itemgetter(*indices)
+        self._min_row_length = max(indices) + 1
+
+    def process(self, lines):
+        import csv
+        import numpy as np
+
+        rows = [
+            self._project(row)
+            for row in csv.reader(lines)
+            if len(row) >= self._min_row_length
+        ]
+        if not rows:
+            return
+
+        (
+            _,
+            flight_dates,
+            wheels_off,
+            airlines,
+            flight_numbers,
+            airports,
+            departure_delays,
+            arrival_delays,
+            taxi_outs,
+            distances,
+            cancelled,
+            diverted,
+            scheduled_departures,
+        ) = (np.array(column) for column in zip(*rows))
+
+        departures, keep = parse_departure_times(
+            flight_dates, wheels_off, scheduled_departures
+        )
+
+        # Missing and malformed values are NaN, build_flights filters them
+        numeric_columns = [
+            parse_float_column(column)[0]
+            for column in (
+                departure_delays,
+                arrival_delays,
+                taxi_outs,
+                distances,
+                cancelled,
+                diverted,
+            )
+        ]
+
+        yield from build_flights(
+            departures, keep, airlines, flight_numbers, airports, *numeric_columns
+        )
+
+
+class ParseFlightTableFn(beam.DoFn):
+    """Converts Arrow tables read from the Parquet dataset into Flight records.
+
+    Applies the same filters and conversions as `ParseFlightBatchFn`.
+    """
+
+    def process(self, table):
+        import numpy as np
+        import pyarrow as pa
+
+        if table.num_rows == 0:
+            return
+
+        def string_column(name):
+            column = table.column(name).cast(pa.string()).fill_null("")
+            return column.to_numpy(zero_copy_only=False).astype(str)
+
+        departures, keep = parse_departure_times(
+            string_column("FlightDate"),
+            string_column("WheelsOff"),
+            string_column("CRSDepTime"),
+        )
+
+        # Nulls become NaN, build_flights filters them
+        numeric_columns = [
+            table.column(name).cast(pa.float64()).fill_null(np.nan).to_numpy()
+            for name in (
+                "DepDelay",
+                "ArrDelay",
+                "TaxiOut",
+                "Distance",
+                "Cancelled",
+                "Diverted",
+            )
+        ]
+
+        yield from build_flights(
+            departures,
+            keep,
+            string_column("Reporting_Airline"),
+            string_column("Flight_Number_Reporting_Airline"),
+            string_column("OriginAirportID"),
+            *numeric_columns,
+        )
+
+
+def build_flights(
+    departures,
+    keep,
+    airlines,
+    flight_numbers,
+    airports,
+    departure_delays,
+    arrival_delays,
+    taxi_outs,
+    distances,
+    cancelled,
+    diverted,
+):
+    """Yields timestamped Flight records for the rows selected by `keep`.
+
+    Numeric columns are NaN where a value is missing. Only cancelled and
+    diverted flights may lack delays, they become None.
+    """
+    import numpy as np
+    from apache_beam.utils.timestamp import Timestamp
+    from feature_pipeline.entities import Flight
+
+    is_cancelled = (cancelled > 0) | (diverted > 0)
+    flight_numbers = np.char.add(np.char.add(airlines, "//"), flight_numbers)
+
+    has_delays = ~(
+        np.isnan(departure_delays) | np.isnan(arrival_delays) | np.isnan(taxi_outs)
+    )
+    selected = np.flatnonzero(
+        keep
+        & ~(np.isnan(distances) | np.isnan(cancelled) | np.isnan(diverted))
+        & (is_cancelled | has_delays)
+    )
+
+    def optional_values(column):
+        return np.where(np.isnan(column), None, column)[selected].tolist()
+
+    for timestamp, micros, values in zip(
+        departures[selected].tolist(),
+        departures[selected].astype(np.int64).tolist(),
+        zip(
+            flight_numbers[selected].tolist(),
+            airports[selected].tolist(),
+            is_cancelled[selected].tolist(),
+            optional_values(departure_delays),
+            optional_values(arrival_delays),
+            optional_values(taxi_outs),
+            distances[selected].tolist(),
+        ),
+    ):
+        yield beam.window.TimestampedValue(
+            Flight(timestamp, *values), Timestamp(micros=micros)
+        )
+
+
+class ParseFlights(beam.PTransform):
+    """Parses raw CSV lines into timestamped Flight records.
+
+    `mode="line"` parses every line on its own with `parse_line`, `mode="batch"`
+    groups lines into batches of `batch_size` and parses them column-wise.
+    """
+
+    def __init__(self, mode="line", batch_size=10000):
+        super().__init__()
+        self.mode = mode
+        self.batch_size = batch_size
+
+    def expand(self, lines):
+        if self.mode == "batch":
+            return (
+                lines
+                | "batch_lines"
+                >> beam.BatchElements(
+                    min_batch_size=self.batch_size, max_batch_size=self.batch_size
+                )
+                | "create_flight_obj"
+                >> beam.ParDo(ParseFlightBatchFn()).with_output_types(Flight)
+            )
+
+        return (
+            lines
+            | "parse_csv" >> beam.Map(parse_csv)
+            | "create_flight_obj" >> beam.FlatMap(parse_line).with_output_types(Flight)
+        )
+
+
+def read_flights(pipeline, file_pattern, known_args, read_label, parse_label):
+    """Reads the flights of `file_pattern` in the configured --input-format."""
+    if known_args.input_format == "parquet":
+        from feature_pipeline.helpers import flight_parquet_columns
+
+        return (
+            pipeline
+            | read_label
+            >> beam.io.ReadFromParquetBatched(
+                file_pattern, columns=flight_parquet_columns
+            )
+            | parse_label >> beam.ParDo(ParseFlightTableFn()).with_output_types(Flight)
+        )
+
+    return (
+        pipeline
+        | read_label >> beam.io.ReadFromText(file_pattern)
+        | parse_label
+        >> ParseFlights(known_args.parse_mode, known_args.parse_batch_size)
+    )
+
+
 class BuildTimestampedRecordFn(beam.DoFn):
     def process(self, element, window=beam.DoFn.WindowParam):
         from feature_pipeline.entities import AirportFeatures
 
+        origin_airport_id, features = element
         window_start = window.start.to_utc_datetime()
         return [
             AirportFeatures(
                 timestamp=window_start,
-                origin_airport_id=element.origin_airport_id,
-                average_departure_delay=element.average_departure_delay,
+                origin_airport_id=origin_airport_id,
+                **features,
             )._asdict()
         ]
 
@@ -72,6 +396,213 @@ class BuildTimestampedFlightRecordFn(beam.DoFn):
         return [element._asdict()]
 
 
+def build_airport_aggregation(known_args):
+    return AggregateAirportFeatures(
+        window_size=known_args.window_size_minutes * 60,
+        window_period=known_args.window_period_minutes * 60,
+        pre_aggregate=known_args.pre_aggregate_windows,
+        hot_key_fanout=known_args.hot_key_fanout,
+        hot_keys=[
+            airport_id
+            for airport_id in known_args.hot_airport_ids.split(",")
+            if airport_id
+        ],
+    )  # 4h time windows, every 60min by default
+
+
+def records_sink(known_args, file_path_prefix, avro_schema, parquet_schema, **kwargs):
+    """Returns the sink for dict records in the configured --output-format."""
+    if known_args.output_format == "parquet":
+        return beam.io.WriteToParquet(
+            file_path_prefix,
+            parquet_schema,
+            codec=known_args.parquet_codec,
+            row_group_buffer_size=known_args.parquet_row_group_bytes,
+            file_name_suffix=".parquet",
+            **kwargs,
+        )
+    return beam.io.WriteToAvro(file_path_prefix, schema=avro_schema, **kwargs)
+
+
+def write_features(flights, airport_features, known_args, name=""):
+    """Writes the airport, flight and read instance outputs.
+
+    `name` prefixes the output files and step labels, so that several
+    partitions can be written by the same pipeline.
+    """
+    label = f"{name}_" if name else ""
+
+    # Create airport data
+    (
+        airport_features
+        | f"{label}add_timestamp" >> beam.ParDo(BuildTimestampedRecordFn())
+        | f"{label}write_airport_data"
+        >> records_sink(
+            known_args,
+            known_args.output_airports + name,
+            airport_avro_schema,
+            airport_parquet_schema,
+        )
+    )
+
+    # Create flight data
+    (
+        flights
+        | f"{label}format_output" >> beam.ParDo(BuildTimestampedFlightRecordFn())
+        | f"{label}write_flight_data"
+        >> records_sink(
+            known_args,
+            known_args.output_flights + name,
+            flight_avro_schema,
+            flight_parquet_schema,
+        )
+    )
+
+    # Create read_instances to retrieve training data from the feature store
+    if known_args.output_format == "parquet":
+        read_instance_files = (
+            flights
+            | f"{label}format_read_instances_output"
+            >> beam.Map(
+                lambda flight: ReadInstance(
+                    flight=flight.flight_number,
+                    airport=flight.origin_airport_id,
+                    timestamp=flight.timestamp,
+                )._asdict()
+            )
+            | f"{label}write_read_instances"
+            >> beam.io.WriteToParquet(
+                known_args.output_read_instances + name,
+                read_instance_parquet_schema,
+                codec=known_args.parquet_codec,
+                row_group_buffer_size=known_args.parquet_row_group_bytes,
+                file_name_suffix=".parquet",
+                num_shards=known_args.read_instances_shards,
+            )
+        )
+    else:
+        read_instance_files = (
+            flights
+            | f"{label}format_read_instances_output"
+            >> beam.Map(
+                lambda flight: f"{flight.flight_number},{flight.origin_airport_id},{flight.timestamp.isoformat('T') + 'Z'}"
+            )
+            | f"{label}write_read_instances"
+            >> beam.io.WriteToText(
+                known_args.output_read_instances + name,
+                file_name_suffix=".csv",
+                num_shards=known_args.read_instances_shards,
+                header="flight,airport,timestamp",
+            )
+        )
+
+    # List all shards in a manifest, so they can be read without matching a glob
+    (
+        read_instance_files
+        | f"{label}collect_read_instance_files" >> beam.combiners.ToList()
+        | f"{label}write_read_instances_manifest"
+        >> beam.Map(
+            write_manifest,
+            known_args.output_read_instances
+            + (f"{name}-manifest.txt" if name else "manifest.txt"),
+        )
+    )
+
+
+def write_manifest(file_names, manifest_path):
+    from apache_beam.io.filesystems import FileSystems
+
+    with FileSystems.create(manifest_path, mime_type="text/plain") as file:
+        file.write("".join(f"{name}\n" for name in sorted(file_names)).encode("utf-8"))
+
+
+def write_combined_manifest(output_prefix):
+    """Lists the shards of all partition manifests in the top-level `manifest.txt`.
+
+    Incremental runs write one `{name}-manifest.txt` per partition, the
+    training pipeline reads `manifest.txt`.
+    """
+    from apache_beam.io.filesystems import FileSystems
+
+    file_names = set()
+    for match in FileSystems.match([f"{output_prefix}*-manifest.txt"]):
+        for metadata in match.metadata_list:
+            with FileSystems.open(metadata.path) as file:
+                file_names.update(file.read().decode("utf-8").split())
+    write_manifest(file_names, f"{output_prefix}manifest.txt")
+
+
+def build_incremental_pipeline(pipeline, partitions, known_args):
+    """Processes every partition as an independent branch of the pipeline.
+
+    The trailing flights of the previous partition are carried over into the
+    airport aggregation, so the sliding windows across the partition boundary
+    are computed from all of their flights.
+    """
+    from datetime import timedelta
+
+    window_period = known_args.window_period_minutes * 60
+    lookback = timedelta(
+        minutes=known_args.window_size_minutes - known_args.window_period_minutes
+    )
+
+    flights = {}
+    bounds = {}
+    for partition in partitions:
+        flights[partition.path] = read_flights(
+            pipeline,
+            partition.path,
+            known_args,
+            f"{partition.name}_read_input",
+            f"{partition.name}_parse_flights",
+        )
+        bounds[partition.path] = flights[
+            partition.path
+        ] | f"{partition.name}_bounds" >> PartitionBounds(window_period)
+
+    for partition in partitions:
+        name = partition.name
+        partition_flights = flights[partition.path]
+        partition_bounds = beam.pvalue.AsSingleton(bounds[partition.path])
+
+        aggregation_input = partition_flights
+        previous_bounds = None
+        if partition.previous:
+            previous_flights = flights.get(partition.previous)
+            if previous_flights is None:
+                previous_flights = read_flights(
+                    pipeline,
+                    partition.previous,
+                    known_args,
+                    f"{name}_read_previous",
+                    f"{name}_parse_previous",
+                )
+                bounds[partition.previous] = (
+                    previous_flights
+                    | f"{name}_previous_bounds" >> PartitionBounds(window_period)
+                )
+            previous_bounds = beam.pvalue.AsSingleton(bounds[partition.previous])
+
+            carried_over = previous_flights | f"{name}_carry_over" >> beam.Filter(
+                is_carried_over, partition_bounds, previous_bounds, lookback
+            )
+            aggregation_input = (
+                partition_flights,
+                carried_over,
+            ) | f"{name}_merge_carry_over" >> beam.Flatten()
+
+        airport_features = (
+            aggregation_input
+            | f"{name}_aggregate_airports" >> build_airport_aggregation(known_args)
+            | f"{name}_keep_partition_windows"
+            >> beam.ParDo(
+                KeepPartitionWindowsFn(lookback), partition_bounds, previous_bounds
+            )
+        )
+
+        write_features(partition_flights, airport_features, known_args, name)
+
+
 def run(argv=None, save_main_session=False):
     """Main entry point; defines and runs the wordcount pipeline."""
 
@@ -82,6 +613,13 @@ def run(argv=None, save_main_session=False):
         default="/Users/simon/projects/private/gcp_mlops/data/processed/2019/2019-01.csv",
         help="Input file to process.",
     )
+    parser.add_argument(
+        "--input-format",
+        dest="input_format",
+        choices=["csv", "parquet"],
+        default="csv",
+        help="Read the input as BTS CSV files or as the Parquet dataset written by download_data.py.",
+    )
     parser.add_argument(
         "--output-airports",
         dest="output_airports",
@@ -103,6 +641,99 @@ def run(argv=None, save_main_session=False):
         help="Output file to write results to.",
     )
 
+    parser.add_argument(
+        "--output-format",
+        dest="output_format",
+        choices=["avro", "parquet"],
+        default="avro",
+        help="Write the features as Avro (and the read instances as CSV) or everything as Parquet.",
+    )
+
+    parser.add_argument(
+        "--parquet-codec",
+        dest="parquet_codec",
+        choices=["none", "snappy", "gzip", "brotli", "lz4", "zstd"],
+        default="snappy",
+        help="Compression codec of the Parquet outputs.",
+    )
+
+    parser.add_argument(
+        "--parquet-row-group-bytes",
+        dest="parquet_row_group_bytes",
+        type=int,
+        default=64 * 1024 * 1024,
+        help="Approximate size of the row groups of the Parquet outputs.",
+    )
+
+    parser.add_argument(
+        "--read-instances-shards",
+        dest="read_instances_shards",
+        type=int,
+        default=0,
+        help="Number of read instance files. Chosen by the runner if 0.",
+    )
+
+    parser.add_argument(
+        "--parse-mode",
+        dest="parse_mode",
+        choices=["line", "batch"],
+        default="line",
+        help="Parse CSV lines one at a time or in column-wise batches.",
+    )
+
+    parser.add_argument(
+        "--parse-batch-size",
+        dest="parse_batch_size",
+        type=int,
+        default=10000,
+        help="Number of CSV lines per batch when using --parse-mode=batch.",
+    )
+
+    parser.add_argument(
+        "--window-size-minutes",
+        dest="window_size_minutes",
+        type=int,
+        default=4 * 60,
+        help="Length of the sliding windows for the airport features.",
+    )
+
+    parser.add_argument(
+        "--window-period-minutes",
+        dest="window_period_minutes",
+        type=int,
+        default=60,
+        help="How often a new sliding window starts.",
+    )
+
+    parser.add_argument(
+        "--pre-aggregate-windows",
+        dest="pre_aggregate_windows",
+        action="store_true",
+        help="Aggregate the airport features per window period before building the sliding windows.",
+    )
+
+    parser.add_argument(
+        "--hot-key-fanout",
+        dest="hot_key_fanout",
+        type=int,
+        default=0,
+        help="Combine the airport features of hot airports in two stages over this many intermediate keys.",
+    )
+
+    parser.add_argument(
+        "--hot-airport-ids",
+        dest="hot_airport_ids",
+        default="",
+        help="Comma-separated airport ids to fan out. Fans out all airports if empty.",
+    )
+
+    parser.add_argument(
+        "--manifest",
+        dest="manifest",
+        default=None,
+        help="Manifest of processed input files. If set, only new or changed files matching --input are processed.",
+    )
+
     # Parse beam arguments (e.g. --runner=DirectRunner to run the pipeline locally)
     known_args, pipeline_args = parser.parse_known_args(argv)
 
@@ -111,54 +742,31 @@ def run(argv=None, save_main_session=False):
     pipeline_options = PipelineOptions(pipeline_args)
     pipeline_options.view_as(SetupOptions).save_main_session = save_main_session
 
-    with beam.Pipeline(options=pipeline_options) as pipeline:
-        flights = (
-            pipeline
-            | "read_input" >> beam.io.ReadFromText(known_args.input)
-            | "parse_csv" >> beam.Map(parse_csv)
-            | "create_flight_obj" >> beam.FlatMap(parse_line).with_output_types(Flight)
-        )
-
-        # Create airport data
-        (
-            flights
-            | "window"
-            >> beam.WindowInto(
-                beam.window.SlidingWindows(4 * 60 * 60, 60 * 60)
-            )  # 4h time windows, every 60min
-            | "group_by_airport"
-            >> beam.GroupBy("origin_airport_id").aggregate_field(
-                "departure_delay_minutes",
-                beam.combiners.MeanCombineFn(),
-                "average_departure_delay",
-            )
-            | "add_timestamp" >> beam.ParDo(BuildTimestampedRecordFn())
-            | "write_airport_data"
-            >> beam.io.WriteToAvro(
-                known_args.output_airports, schema=airport_avro_schema
-            )
+    if known_args.manifest:
+        partitions, updated_manifest = plan_partitions(
+            known_args.input, load_manifest(known_args.manifest)
         )
-
-        # Create flight data
-        (
-            flights
-            | "format_output" >> beam.ParDo(BuildTimestampedFlightRecordFn())
-            | "write_flight_data"
-            >> beam.io.WriteToAvro(known_args.output_flights, schema=flight_avro_schema)
+        logging.info(
+            "Processing %d new partitions: %s",
+            len(partitions),
+            [partition.path for partition in partitions],
         )
+        if not partitions:
+            write_combined_manifest(known_args.output_read_instances)
+            return
 
-        # Create read_instances.csv to retrieve training data from the feature store
-        (
-            flights
-            | "format_read_instances_output"
-            >> beam.Map(
-                lambda flight: f"{flight.flight_number},{flight.origin_airport_id},{flight.timestamp.isoformat('T') + 'Z'}"
+    with beam.Pipeline(options=pipeline_options) as pipeline:
+        if known_args.manifest:
+            build_incremental_pipeline(pipeline, partitions, known_args)
+        else:
+            flights = read_flights(
+                pipeline, known_args.input, known_args, "read_input", "parse_flights"
             )
-            | "write_read_instances"
-            >> beam.io.WriteToText(
-                known_args.output_read_instances,
-                file_name_suffix=".csv",
-                num_shards=1,
-                header="flight,airport,timestamp",
+            airport_features = (
+                flights | "aggregate_airports" >> build_airport_aggregation(known_args)
             )
-        )
+            write_features(flights, airport_features, known_args)
+
+    if known_args.manifest:
+        write_combined_manifest(known_args.output_read_instances)
+        save_manifest(known_args.manifest, updated_manifest)
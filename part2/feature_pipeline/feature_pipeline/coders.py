@@ -0,0 +1,124 @@
+import struct
+from datetime import datetime, timedelta, timezone
+from typing import Union, get_args, get_origin
+
+import apache_beam as beam
+
+EPOCH = datetime(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+# struct format per field type, strings are stored as their length in bytes
+STRUCT_FORMATS = {float: "d", bool: "?", int: "q", datetime: "q", str: "I"}
+
+
+def field_spec(field_type):
+    """Returns the (type, optional) pair of a NamedTuple annotation."""
+    if get_origin(field_type) == Union:
+        field_types = [t for t in get_args(field_type) if t is not type(None)]
+        if len(field_types) != 1:
+            raise TypeError(f"Unsupported type: {field_type}")
+        return field_types[0], True
+
+    if field_type not in STRUCT_FORMATS:
+        raise TypeError(f"Unsupported type: {field_type}")
+    return field_type, False
+
+
+def to_micros(timestamp: datetime) -> int:
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return (timestamp - EPOCH) // ONE_MICROSECOND
+
+
+class NamedTupleCoder(beam.coders.Coder):
+    """Compact binary coder for the NamedTuple entities.
+
+    All fixed-size fields are packed with a single struct: floats as doubles,
+    ints as int64, bools as one byte and datetimes as int64 microseconds since
+    the epoch (naive datetimes are UTC). Strings are stored as their length
+    followed by the UTF-8 bytes after the struct. Optional fields carry a
+    presence flag.
+
+    Registered for `Flight` and `AirportFeatures` in `entities.py`, so Beam
+    uses it instead of falling back to pickling.
+    """
+
+    def __init__(self, named_tuple):
+        self.named_tuple = named_tuple
+        self._fields = [
+            field_spec(field_type)
+            for field_type in named_tuple.__annotations__.values()
+        ]
+        self._struct = struct.Struct(
+            "<"
+            + "".join(
+                ("?" if optional else "") + STRUCT_FORMATS[field_type]
+                for field_type, optional in self._fields
+            )
+        )
+
+    @classmethod
+    def from_type_hint(cls, typehint, registry):
+        return cls(typehint)
+
+    def to_type_hint(self):
+        return self.named_tuple
+
+    def is_deterministic(self):
+        return True
+
+    def encode(self, value):
+        packed = []
+        strings = []
+        for (field_type, optional), field in zip(self._fields, value):
+            if optional:
+                packed.append(field is not None)
+                if field is None:
+                    packed.append(0)
+                    continue
+
+            if field_type is str:
+                encoded = field.encode("utf-8")
+                strings.append(encoded)
+                packed.append(len(encoded))
+            elif field_type is datetime:
+                packed.append(to_micros(field))
+            else:
+                packed.append(field)
+
+        return self._struct.pack(*packed) + b"".join(strings)
+
+    def decode(self, encoded):
+        packed = self._struct.unpack_from(encoded)
+        offset = self._struct.size
+        values = []
+        append = values.append
+        i = 0
+        for field_type, optional in self._fields:
+            if optional:
+                i += 1
+                if not packed[i - 1]:
+                    append(None)
+                    i += 1
+                    continue
+            field = packed[i]
+            i += 1
+
+            if field_type is str:
+                append(encoded[offset : offset + field].decode("utf-8"))
+                offset += field
+            elif field_type is datetime:
+                append(EPOCH + timedelta(0, 0, field))
+            else:
+                append(field)
+
+        return self.named_tuple._make(values)
+
+    def __reduce__(self):
+        return NamedTupleCoder, (self.named_tuple,)
+
+    def __eq__(self, other):
+        return type(self) == type(other) and self.named_tuple == other.named_tuple
+
+    def __hash__(self):
+        return hash((type(self), self.named_tuple))
@@ -0,0 +1,97 @@
+import math
+
+import apache_beam as beam
+
+# Departure delays are reported in whole minutes. The quantile histogram keeps one
+# bin per minute and clamps outliers, so it never holds more than ~1.5k bins.
+MIN_HISTOGRAM_DELAY = -120
+MAX_HISTOGRAM_DELAY = 24 * 60
+
+
+def histogram_quantile(histogram, count, quantile):
+    """Returns the nearest-rank quantile of a {delay_minutes: count} histogram."""
+    rank = max(1, math.ceil(quantile * count))
+    seen = 0
+    for delay in sorted(histogram):
+        seen += histogram[delay]
+        if seen >= rank:
+            return float(delay)
+    return float("NaN")
+
+
+class AirportStatsCombineFn(beam.CombineFn):
+    """Computes all airport features of a window in a single pass.
+
+    Inputs are `FlightStats` (`(departure_delay_minutes, taxi_out_minutes,
+    is_cancelled)`) tuples. The accumulator is `[flight_count, departure_delay_sum,
+    taxi_out_sum, cancelled_count, departure_delay_histogram]`, where the
+    histogram counts the flights per (clamped) minute of departure delay and
+    is used to compute the delay quantiles.
+
+    Cancelled (and diverted) flights count towards the flight count and the
+    cancellation rate, but not towards the delay and taxi-out features.
+    """
+
+    def create_accumulator(self):
+        return [0, 0.0, 0.0, 0, {}]
+
+    def add_input(self, accumulator, element):
+        departure_delay, taxi_out, is_cancelled = element
+        accumulator[0] += 1
+        if is_cancelled:
+            accumulator[3] += 1
+            return accumulator
+
+        accumulator[1] += departure_delay
+        accumulator[2] += taxi_out
+
+        delay_bin = min(
+            max(int(round(departure_delay)), MIN_HISTOGRAM_DELAY), MAX_HISTOGRAM_DELAY
+        )
+        histogram = accumulator[4]
+        histogram[delay_bin] = histogram.get(delay_bin, 0) + 1
+        return accumulator
+
+    def merge_accumulators(self, accumulators):
+        merged = self.create_accumulator()
+        histogram = merged[4]
+        for count, delay_sum, taxi_out_sum, cancelled, delays in accumulators:
+            merged[0] += count
+            merged[1] += delay_sum
+            merged[2] += taxi_out_sum
+            merged[3] += cancelled
+            for delay_bin, delay_count in delays.items():
+                histogram[delay_bin] = histogram.get(delay_bin, 0) + delay_count
+        return merged
+
+    def extract_output(self, accumulator):
+        count, delay_sum, taxi_out_sum, cancelled, histogram = accumulator
+        if count == 0:
+            return dict(
+                flight_count=0,
+                average_departure_delay=float("NaN"),
+                p50_departure_delay=float("NaN"),
+                p90_departure_delay=float("NaN"),
+                average_taxi_out=float("NaN"),
+                cancellation_rate=float("NaN"),
+            )
+
+        departed = count - cancelled
+        if departed == 0:
+            return dict(
+                flight_count=count,
+                average_departure_delay=float("NaN"),
+                p50_departure_delay=float("NaN"),
+                p90_departure_delay=float("NaN"),
+                average_taxi_out=float("NaN"),
+                cancellation_rate=1.0,
+            )
+
+        return dict(
+            flight_count=count,
+            average_departure_delay=delay_sum / departed,
+            p50_departure_delay=histogram_quantile(histogram, departed, 0.5),
+            p90_departure_delay=histogram_quantile(histogram, departed, 0.9),
+            average_taxi_out=taxi_out_sum / departed,
+            cancellation_rate=cancelled / count,
+        )
@@ -1,7 +1,13 @@
-from typing import NamedTuple, Optional
+from typing import NamedTuple, Optional, Tuple
 from datetime import datetime
 
-from feature_pipeline.helpers import named_tuple_to_avro_fields
+import apache_beam as beam
+
+from feature_pipeline.coders import NamedTupleCoder
+from feature_pipeline.helpers import (
+    named_tuple_to_avro_fields,
+    named_tuple_to_parquet_schema,
+)
 
 
 class Flight(NamedTuple):
@@ -9,9 +15,10 @@ class Flight(NamedTuple):
     flight_number: str
     origin_airport_id: str
     is_cancelled: bool
-    departure_delay_minutes: float
-    arrival_delay_minutes: float
-    taxi_out_minutes: float
+    # Cancelled and diverted flights lack some of the delays
+    departure_delay_minutes: Optional[float]
+    arrival_delay_minutes: Optional[float]
+    taxi_out_minutes: Optional[float]
     distance_miles: float
 
 
@@ -22,11 +29,18 @@ flight_avro_schema = {
     "fields": named_tuple_to_avro_fields(Flight),
 }
 
+flight_parquet_schema = named_tuple_to_parquet_schema(Flight)
+
 
 class AirportFeatures(NamedTuple):
     timestamp: Optional[datetime]
     origin_airport_id: str
     average_departure_delay: float
+    flight_count: int
+    p50_departure_delay: float
+    p90_departure_delay: float
+    average_taxi_out: float
+    cancellation_rate: float
 
 
 airport_avro_schema = {
@@ -35,3 +49,25 @@ airport_avro_schema = {
     "name": "Airport",
     "fields": named_tuple_to_avro_fields(AirportFeatures),
 }
+
+airport_parquet_schema = named_tuple_to_parquet_schema(AirportFeatures)
+
+
+# Value of a flight keyed by airport, the input of AirportStatsCombineFn:
+# (departure_delay_minutes, taxi_out_minutes, is_cancelled). A plain tuple, so
+# that Beam encodes it with the Cython FastPrimitivesCoder, which takes a few
+# bytes more than NamedTupleCoder but far less CPU (see coder_benchmark.py)
+FlightStats = Tuple[Optional[float], Optional[float], bool]
+
+
+class ReadInstance(NamedTuple):
+    flight: str
+    airport: str
+    timestamp: datetime
+
+
+read_instance_parquet_schema = named_tuple_to_parquet_schema(ReadInstance)
+
+
+beam.coders.registry.register_coder(Flight, NamedTupleCoder)
+beam.coders.registry.register_coder(AirportFeatures, NamedTupleCoder)
@@ -7,6 +7,8 @@ def map_to_avro_type(field_type):
         return "string"
     elif field_type == bool:
         return "boolean"
+    elif field_type == int:
+        return "long"
     elif field_type == float:
         return "double"
     elif field_type is type(None):
@@ -26,6 +28,42 @@ def named_tuple_to_avro_fields(named_tuple):
     return fields
 
 
+def map_to_arrow_type(field_type):
+    import pyarrow as pa
+
+    if field_type == str:
+        return pa.string()
+    elif field_type == bool:
+        return pa.bool_()
+    elif field_type == int:
+        return pa.int64()
+    elif field_type == float:
+        return pa.float64()
+    elif field_type == datetime:
+        return pa.timestamp("us", tz="UTC")
+    elif get_origin(field_type) == Union:
+        field_types = [t for t in get_args(field_type) if t is not type(None)]
+        if len(field_types) != 1:
+            raise NotImplementedError(f"Unsupported type: {field_type}")
+        return map_to_arrow_type(field_types[0])
+    else:
+        raise NotImplementedError(f"Unsupported type: {field_type}")
+
+
+def named_tuple_to_parquet_schema(named_tuple):
+    import pyarrow as pa
+
+    fields = []
+    for field_name, field_type in named_tuple.__annotations__.items():
+        nullable = get_origin(field_type) == Union and type(None) in get_args(
+            field_type
+        )
+        fields.append(
+            pa.field(field_name, map_to_arrow_type(field_type), nullable=nullable)
+        )
+    return pa.schema(fields)
+
+
 csv_headers = [
     "Year",
     "Quarter",
@@ -137,3 +175,24 @@ csv_headers = [
     "Div5WheelsOff",
     "Div5TailNum",
 ]
+
+
+# Columns needed to build a Flight record, used to project CSV rows before parsing
+flight_csv_columns = [
+    "Year",
+    "FlightDate",
+    "WheelsOff",
+    "Reporting_Airline",
+    "Flight_Number_Reporting_Airline",
+    "OriginAirportID",
+    "DepDelay",
+    "ArrDelay",
+    "TaxiOut",
+    "Distance",
+    "Cancelled",
+    "Diverted",
+    "CRSDepTime",
+]
+
+# Columns read from the Parquet dataset, which has no header rows to skip
+flight_parquet_columns = flight_csv_columns[1:]
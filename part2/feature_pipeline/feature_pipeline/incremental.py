@@ -0,0 +1,168 @@
+import json
+import posixpath
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+
+import apache_beam as beam
+from apache_beam.io.filesystems import FileSystems
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class Partition(NamedTuple):
+    path: str
+    name: str
+    previous: Optional[str]  # path of the partition before this one, if any
+
+
+def load_manifest(manifest_path: str) -> dict:
+    if not FileSystems.exists(manifest_path):
+        return {}
+    with FileSystems.open(manifest_path) as file:
+        return json.loads(file.read().decode("utf-8"))
+
+
+def save_manifest(manifest_path: str, manifest: dict):
+    with FileSystems.create(manifest_path, mime_type="application/json") as file:
+        file.write(json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+
+
+def partition_name(path: str) -> str:
+    return posixpath.basename(path).split(".")[0]
+
+
+def plan_partitions(input_pattern: str, manifest: dict):
+    """Matches the input files and returns the partitions that need processing.
+
+    Files are ordered by path, so monthly partitions (`2021/2021-12.csv`) are in
+    chronological order. A file is processed if it is not in the manifest or if
+    its size or modification time changed since it was processed.
+
+    Returns the partitions to process and the updated manifest.
+    """
+    files = sorted(
+        (
+            metadata
+            for match in FileSystems.match([input_pattern])
+            for metadata in match.metadata_list
+        ),
+        key=lambda metadata: metadata.path,
+    )
+
+    updated_manifest = {}
+    pending = []
+    for metadata in files:
+        entry = {
+            "size_in_bytes": metadata.size_in_bytes,
+            "last_updated_in_seconds": metadata.last_updated_in_seconds,
+        }
+        updated_manifest[metadata.path] = entry
+        pending.append(manifest.get(metadata.path) != entry)
+
+    paths = [metadata.path for metadata in files]
+    partitions = [
+        Partition(
+            path=path,
+            name=partition_name(path),
+            previous=paths[i - 1] if i > 0 else None,
+        )
+        for i, path in enumerate(paths)
+        if pending[i]
+    ]
+    return partitions, updated_manifest
+
+
+class TimestampRangeCombineFn(beam.CombineFn):
+    """Computes the earliest and latest of a collection of timestamps."""
+
+    def create_accumulator(self):
+        return None, None
+
+    def add_input(self, accumulator, timestamp):
+        start, end = accumulator
+        if start is None:
+            return timestamp, timestamp
+        return min(start, timestamp), max(end, timestamp)
+
+    def merge_accumulators(self, accumulators):
+        starts = [start for start, _ in accumulators if start is not None]
+        ends = [end for _, end in accumulators if end is not None]
+        return min(starts, default=None), max(ends, default=None)
+
+    def extract_output(self, accumulator):
+        return accumulator
+
+
+def floor_to_period(timestamp: datetime, period: int) -> datetime:
+    """Aligns a timestamp to the start of its window period (windows start at the epoch)."""
+    seconds = int((timestamp - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=seconds - seconds % period)
+
+
+class PartitionBounds(beam.PTransform):
+    """Computes the `(start, end)` period bounds of the flights of a partition.
+
+    `start` is the start of the first period that contains a flight of the
+    partition and `end` the end of the last one.
+    """
+
+    def __init__(self, window_period: int):
+        super().__init__()
+        self.window_period = window_period
+
+    def expand(self, flights):
+        window_period = self.window_period
+
+        def align(timestamp_range):
+            start, end = timestamp_range
+            if start is None:
+                return None, None
+            return (
+                floor_to_period(start, window_period),
+                floor_to_period(end, window_period) + timedelta(seconds=window_period),
+            )
+
+        return (
+            flights
+            | "flight_timestamps" >> beam.Map(lambda flight: flight.timestamp)
+            | "timestamp_range" >> beam.CombineGlobally(TimestampRangeCombineFn())
+            | "align_to_periods" >> beam.Map(align)
+        )
+
+
+def owned_periods(bounds, previous_bounds):
+    """Returns the `(start, end)` range of last periods whose windows a partition emits.
+
+    A partition owns the windows whose last period starts between the end of
+    the previous partition (or its own start, if it is the first one) and its
+    own end. Consecutive partitions therefore own adjacent ranges, whether
+    they are processed in the same run or not. Windows that reach past the end
+    of the latest partition are emitted once the next one is processed.
+    """
+    start, end = bounds
+    if previous_bounds is not None and previous_bounds[1] is not None:
+        start = previous_bounds[1]
+    return start, end
+
+
+def is_carried_over(flight, bounds, previous_bounds, lookback: timedelta) -> bool:
+    """Whether a flight of the previous partition falls into a window of this partition."""
+    start, _ = owned_periods(bounds, previous_bounds)
+    return start is not None and flight.timestamp >= start - lookback
+
+
+class KeepPartitionWindowsFn(beam.DoFn):
+    """Keeps the windows that belong to a partition, see `owned_periods`.
+
+    Windows that overlap the previous partition are complete because the
+    trailing flights of that partition are carried over.
+    """
+
+    def __init__(self, lookback: timedelta):
+        self.lookback = lookback
+
+    def process(self, element, bounds, previous_bounds, window=beam.DoFn.WindowParam):
+        start, end = owned_periods(bounds, previous_bounds)
+        last_period_start = window.start.to_utc_datetime() + self.lookback
+        if start is not None and end is not None and start <= last_period_start < end:
+            yield element
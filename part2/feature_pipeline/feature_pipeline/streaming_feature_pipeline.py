@@ -0,0 +1,260 @@
+import argparse
+import json
+import logging
+
+import apache_beam as beam
+from apache_beam.options.pipeline_options import PipelineOptions
+from apache_beam.options.pipeline_options import SetupOptions
+from apache_beam.options.pipeline_options import StandardOptions
+from apache_beam.transforms import trigger
+
+from feature_pipeline.aggregations import AggregateAirportFeatures
+from feature_pipeline.batch_feature_pipeline import ParseFlights
+from feature_pipeline.entities import AirportFeatures
+
+
+class WatchDirectorySource(beam.PTransform):
+    """Reads the lines of every new file matching `file_pattern`.
+
+    The pattern is matched again every `interval` seconds.
+    """
+
+    def __init__(self, file_pattern, interval=60):
+        super().__init__()
+        self.file_pattern = file_pattern
+        self.interval = interval
+
+    def expand(self, pipeline):
+        from apache_beam.io import fileio
+
+        return (
+            pipeline
+            | "match_files"
+            >> fileio.MatchContinuously(self.file_pattern, interval=self.interval)
+            | "file_paths" >> beam.Map(lambda metadata: metadata.path)
+            | "read_lines" >> beam.io.ReadAllFromText()
+        )
+
+
+class PubSubSource(beam.PTransform):
+    """Reads CSV lines published as Pub/Sub messages."""
+
+    def __init__(self, subscription):
+        super().__init__()
+        self.subscription = subscription
+
+    def expand(self, pipeline):
+        return (
+            pipeline
+            | "read_messages" >> beam.io.ReadFromPubSub(subscription=self.subscription)
+            | "decode_lines" >> beam.Map(lambda message: message.decode("utf-8"))
+        )
+
+
+class InMemorySource(beam.PTransform):
+    """In-memory stand-in for Pub/Sub that replays CSV lines with a TestStream.
+
+    `batches` is a list of `(lines, watermark)` pairs. The lines of each batch
+    are emitted and the watermark is then advanced to `watermark` (seconds
+    since the epoch, or None to keep it). Only runs on the DirectRunner.
+    """
+
+    def __init__(self, batches):
+        super().__init__()
+        self.batches = batches
+
+    def expand(self, pipeline):
+        from apache_beam.testing.test_stream import TestStream
+
+        stream = TestStream()
+        for lines, watermark in self.batches:
+            stream = stream.add_elements(list(lines))
+            if watermark is not None:
+                stream = stream.advance_watermark_to(watermark)
+
+        return pipeline | "replay_lines" >> stream.advance_watermark_to_infinity()
+
+
+class LogSink(beam.PTransform):
+    """Logs every airport feature update."""
+
+    def expand(self, airport_features):
+        return airport_features | "log_features" >> beam.Map(
+            lambda features: logging.info("Airport features: %s", features)
+        )
+
+
+class PubSubSink(beam.PTransform):
+    """Publishes every airport feature update as a JSON message."""
+
+    def __init__(self, topic):
+        super().__init__()
+        self.topic = topic
+
+    def expand(self, airport_features):
+        return (
+            airport_features
+            | "encode_json"
+            >> beam.Map(
+                lambda features: json.dumps(
+                    {**features._asdict(), "timestamp": features.timestamp.isoformat()}
+                ).encode("utf-8")
+            )
+            | "publish_features" >> beam.io.WriteToPubSub(self.topic)
+        )
+
+
+class BuildAirportFeaturesFn(beam.DoFn):
+    def process(self, element, window=beam.DoFn.WindowParam):
+        origin_airport_id, features = element
+        yield AirportFeatures(
+            timestamp=window.start.to_utc_datetime(),
+            origin_airport_id=origin_airport_id,
+            **features,
+        )
+
+
+class StreamingAirportFeatures(beam.PTransform):
+    """Turns a stream of CSV lines into incremental AirportFeatures updates.
+
+    Every window emits early results every `early_firing_delay` seconds while
+    flights arrive, an on-time result once the watermark passes the end of the
+    window, and a late update for every flight that arrives within
+    `allowed_lateness` seconds after that. Updates accumulate, so every update
+    contains all flights of the window seen so far.
+    """
+
+    def __init__(
+        self,
+        window_size=4 * 60 * 60,
+        window_period=60 * 60,
+        early_firing_delay=60,
+        allowed_lateness=60 * 60,
+        parse_mode="line",
+        parse_batch_size=10000,
+    ):
+        super().__init__()
+        self.window_size = window_size
+        self.window_period = window_period
+        self.early_firing_delay = early_firing_delay
+        self.allowed_lateness = allowed_lateness
+        self.parse_mode = parse_mode
+        self.parse_batch_size = parse_batch_size
+
+    def expand(self, lines):
+        return (
+            lines
+            | "parse_flights" >> ParseFlights(self.parse_mode, self.parse_batch_size)
+            | "aggregate_airports"
+            >> AggregateAirportFeatures(
+                window_size=self.window_size,
+                window_period=self.window_period,
+                trigger=trigger.AfterWatermark(
+                    early=trigger.AfterProcessingTime(self.early_firing_delay),
+                    late=trigger.AfterCount(1),
+                ),
+                accumulation_mode=trigger.AccumulationMode.ACCUMULATING,
+                allowed_lateness=self.allowed_lateness,
+            )
+            | "build_features"
+            >> beam.ParDo(BuildAirportFeaturesFn()).with_output_types(AirportFeatures)
+        )
+
+
+def build_streaming_pipeline(pipeline, source, sink, **kwargs):
+    """Connects `source` (CSV lines) to `sink` (AirportFeatures updates)."""
+    return (
+        pipeline
+        | "read_source" >> source
+        | "airport_features" >> StreamingAirportFeatures(**kwargs)
+        | "write_sink" >> sink
+    )
+
+
+def run(argv=None, save_main_session=False):
+    """Entry point of the streaming feature pipeline."""
+
+    parser = argparse.ArgumentParser()
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument(
+        "--input-pattern",
+        dest="input_pattern",
+        help="Watch for new files matching this pattern.",
+    )
+    source.add_argument(
+        "--input-subscription",
+        dest="input_subscription",
+        help="Read CSV lines from this Pub/Sub subscription.",
+    )
+
+    parser.add_argument(
+        "--output-topic",
+        dest="output_topic",
+        default=None,
+        help="Publish the airport features to this Pub/Sub topic. Logs them if not set.",
+    )
+
+    parser.add_argument(
+        "--window-size-minutes",
+        dest="window_size_minutes",
+        type=int,
+        default=4 * 60,
+        help="Length of the sliding windows for the airport features.",
+    )
+
+    parser.add_argument(
+        "--window-period-minutes",
+        dest="window_period_minutes",
+        type=int,
+        default=60,
+        help="How often a new sliding window starts.",
+    )
+
+    parser.add_argument(
+        "--early-firing-seconds",
+        dest="early_firing_seconds",
+        type=int,
+        default=60,
+        help="Emit early results of open windows at most this often.",
+    )
+
+    parser.add_argument(
+        "--allowed-lateness-minutes",
+        dest="allowed_lateness_minutes",
+        type=int,
+        default=60,
+        help="Update windows with flights arriving up to this late.",
+    )
+
+    parser.add_argument(
+        "--parse-mode",
+        dest="parse_mode",
+        choices=["line", "batch"],
+        default="line",
+        help="Parse CSV lines one at a time or in column-wise batches.",
+    )
+
+    known_args, pipeline_args = parser.parse_known_args(argv)
+
+    pipeline_options = PipelineOptions(pipeline_args)
+    pipeline_options.view_as(SetupOptions).save_main_session = save_main_session
+    pipeline_options.view_as(StandardOptions).streaming = True
+
+    if known_args.input_subscription:
+        source = PubSubSource(known_args.input_subscription)
+    else:
+        source = WatchDirectorySource(known_args.input_pattern)
+
+    sink = PubSubSink(known_args.output_topic) if known_args.output_topic else LogSink()
+
+    with beam.Pipeline(options=pipeline_options) as pipeline:
+        build_streaming_pipeline(
+            pipeline,
+            source,
+            sink,
+            window_size=known_args.window_size_minutes * 60,
+            window_period=known_args.window_period_minutes * 60,
+            early_firing_delay=known_args.early_firing_seconds,
+            allowed_lateness=known_args.allowed_lateness_minutes * 60,
+            parse_mode=known_args.parse_mode,
+        )
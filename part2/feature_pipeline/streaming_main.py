@@ -0,0 +1,6 @@
+import logging
+from feature_pipeline.streaming_feature_pipeline import run
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.INFO)
+    run()
@@ -0,0 +1,114 @@
+import csv
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import fastavro
+
+from feature_pipeline.batch_feature_pipeline import run
+from feature_pipeline.helpers import csv_headers
+
+# Flights on the first and last day of every month, with gaps of several
+# hours around the month boundaries
+MONTHS = {
+    "2021-11": [(datetime(2021, 11, 1, 4), 12), (datetime(2021, 11, 30, 8), 12)],
+    "2021-12": [(datetime(2021, 12, 1, 2), 14), (datetime(2021, 12, 31, 6), 14.5)],
+    "2022-01": [(datetime(2022, 1, 1, 2, 15), 10), (datetime(2022, 1, 31, 5), 12)],
+}
+
+
+def write_month(input_dir: Path, month: str, rng: random.Random):
+    path = input_dir / month[:4] / f"{month}.csv"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(csv_headers)
+        for start, hours in MONTHS[month]:
+            for i in range(60):
+                # The first and last flights of a day are at its exact bounds
+                offset = 0 if i == 0 else hours if i == 1 else rng.uniform(0, hours)
+                departure = start + timedelta(hours=offset)
+                row = {
+                    "Year": str(departure.year),
+                    "FlightDate": departure.strftime("%Y-%m-%d"),
+                    "Reporting_Airline": "AA",
+                    "Flight_Number_Reporting_Airline": str(i),
+                    "OriginAirportID": str(rng.choice([10397, 13930, 12892])),
+                    "CRSDepTime": departure.strftime("%H%M"),
+                    "WheelsOff": departure.strftime("%H%M"),
+                    "DepDelay": str(rng.randrange(-10, 60)),
+                    "ArrDelay": str(rng.randrange(-20, 90)),
+                    "TaxiOut": str(rng.randrange(5, 30)),
+                    "Distance": "500",
+                    "Cancelled": "0",
+                    "Diverted": "0",
+                }
+                writer.writerow([row.get(name, "") for name in csv_headers])
+
+
+def run_pipeline(input_pattern: str, output_dir: Path, *args):
+    for output in ("airports", "flights", "read_instances"):
+        (output_dir / output).mkdir(parents=True, exist_ok=True)
+    run(
+        [
+            f"--input={input_pattern}",
+            f"--output-airports={output_dir}/airports/",
+            f"--output-flights={output_dir}/flights/",
+            f"--output-read-instances={output_dir}/read_instances/",
+            "--runner=DirectRunner",
+            *args,
+        ]
+    )
+
+
+def airport_features(output_dir: Path):
+    records = []
+    for path in (output_dir / "airports").iterdir():
+        with open(path, "rb") as file:
+            records.extend(fastavro.reader(file))
+    return sorted(
+        (
+            record["timestamp"],
+            record["origin_airport_id"],
+            record["flight_count"],
+            round(record["average_departure_delay"], 6),
+        )
+        for record in records
+    )
+
+
+def test_split_runs_match_a_full_run(tmp_path):
+    rng = random.Random(42)
+    input_dir = tmp_path / "input"
+    for month in MONTHS:
+        write_month(input_dir, month, rng)
+    input_pattern = f"{input_dir}/*/*.csv"
+
+    run_pipeline(input_pattern, tmp_path / "full")
+    expected = airport_features(tmp_path / "full")
+    # Windows that reach past the last flight wait for the next partition
+    last_flight = max(
+        start + timedelta(hours=hours) for start, hours in MONTHS["2022-01"]
+    )
+    last_window_start = last_flight.replace(minute=0) - timedelta(hours=3)
+    expected = [
+        row for row in expected if row[0].replace(tzinfo=None) <= last_window_start
+    ]
+
+    # All months in one run, and one month per run
+    run_pipeline(
+        input_pattern, tmp_path / "single", f"--manifest={tmp_path}/single.json"
+    )
+    for month in MONTHS:
+        (input_dir / "split" / month[:4]).mkdir(parents=True, exist_ok=True)
+        (input_dir / month[:4] / f"{month}.csv").rename(
+            input_dir / "split" / month[:4] / f"{month}.csv"
+        )
+        run_pipeline(
+            f"{input_dir}/split/*/*.csv",
+            tmp_path / "split",
+            f"--manifest={tmp_path}/split.json",
+        )
+
+    assert airport_features(tmp_path / "single") == expected
+    assert airport_features(tmp_path / "split") == expected
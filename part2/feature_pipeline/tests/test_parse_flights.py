@@ -0,0 +1,141 @@
+import csv
+import io
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pytest
+
+from feature_pipeline.batch_feature_pipeline import (
+    ParseFlightBatchFn,
+    ParseFlightTableFn,
+    parse_csv,
+    parse_line,
+)
+from feature_pipeline.helpers import csv_headers, flight_parquet_columns
+
+NUMERIC_COLUMNS = [
+    "DepDelay",
+    "ArrDelay",
+    "TaxiOut",
+    "Distance",
+    "Cancelled",
+    "Diverted",
+]
+
+
+def csv_line(**values):
+    row = {
+        "Year": "2021",
+        "FlightDate": "2021-12-24",
+        "Reporting_Airline": "AA",
+        "Flight_Number_Reporting_Airline": "100",
+        "OriginAirportID": "10397",
+        "CRSDepTime": "0900",
+        "WheelsOff": "0915",
+        "DepDelay": "5.00",
+        "ArrDelay": "-3.00",
+        "TaxiOut": "10.00",
+        "Distance": "481.00",
+        "Cancelled": "0.00",
+        "Diverted": "0.00",
+    }
+    row.update(values)
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="").writerow(
+        [row.get(name, "") for name in csv_headers]
+    )
+    return buffer.getvalue()
+
+
+EDGE_CASES = {
+    "completed": csv_line(),
+    "cancelled": csv_line(
+        WheelsOff="", DepDelay="", ArrDelay="", TaxiOut="", Cancelled="1.00"
+    ),
+    "diverted": csv_line(ArrDelay="", Diverted="1.00"),
+    "wheels_off_2400": csv_line(WheelsOff="2400"),
+    "wheels_off_three_digits": csv_line(WheelsOff="930"),
+    "wheels_off_malformed": csv_line(WheelsOff="12a4"),
+    "cancelled_without_schedule": csv_line(
+        WheelsOff="", CRSDepTime="", DepDelay="", Cancelled="1.00"
+    ),
+    "completed_without_delay": csv_line(DepDelay=""),
+    "without_distance": csv_line(Distance=""),
+    "malformed_delay": csv_line(TaxiOut="n/a"),
+    "malformed_date": csv_line(FlightDate="2021-13-01"),
+}
+
+
+def as_tuples(timestamped_values):
+    return [(value.value, value.timestamp) for value in timestamped_values]
+
+
+def parse_lines(lines):
+    return as_tuples(flight for line in lines for flight in parse_line(parse_csv(line)))
+
+
+def parse_batch(lines):
+    parse_fn = ParseFlightBatchFn()
+    parse_fn.setup()
+    return as_tuples(parse_fn.process(lines))
+
+
+def parse_table(lines):
+    # Same column types as the Parquet dataset of part1/download_data.py
+    table = pa_csv.read_csv(
+        io.BytesIO("\n".join([",".join(csv_headers), *lines]).encode()),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=flight_parquet_columns,
+            column_types={
+                name: pa.float32() if name in NUMERIC_COLUMNS else pa.string()
+                for name in flight_parquet_columns
+            },
+            strings_can_be_null=False,
+        ),
+    )
+    return as_tuples(ParseFlightTableFn().process(table))
+
+
+@pytest.mark.parametrize("case", EDGE_CASES)
+def test_batch_parsing_matches_line_parsing(case):
+    lines = [EDGE_CASES[case]]
+    assert parse_batch(lines) == parse_lines(lines)
+
+
+@pytest.mark.parametrize(
+    "case", [case for case in EDGE_CASES if case != "malformed_delay"]
+)
+def test_table_parsing_matches_line_parsing(case):
+    # Malformed numbers can't be read into the typed Parquet columns
+    lines = [EDGE_CASES[case]]
+    assert parse_table(lines) == parse_lines(lines)
+
+
+def test_edge_cases():
+    flights = {case: parse_lines([line]) for case, line in EDGE_CASES.items()}
+
+    assert flights["completed"][0][0].timestamp.isoformat() == "2021-12-24T09:15:00"
+    # Flights that never took off are timed by their scheduled departure
+    cancelled = flights["cancelled"][0][0]
+    assert cancelled.is_cancelled
+    assert cancelled.timestamp.isoformat() == "2021-12-24T09:00:00"
+    assert cancelled.departure_delay_minutes is None
+    assert flights["diverted"][0][0].arrival_delay_minutes is None
+    # A flight that took off keeps its WheelsOff time or is dropped
+    for case in [
+        "wheels_off_2400",
+        "wheels_off_three_digits",
+        "wheels_off_malformed",
+        "cancelled_without_schedule",
+        "completed_without_delay",
+        "without_distance",
+        "malformed_delay",
+        "malformed_date",
+    ]:
+        assert flights[case] == [], case
+
+
+def test_header_row_is_skipped():
+    header = ",".join(csv_headers)
+    assert parse_lines([header]) == []
+    assert parse_batch([header]) == []
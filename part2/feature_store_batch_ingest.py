@@ -29,7 +29,14 @@ flight_entity_type.ingest_from_gcs(
 
 airport_entity_type = flight_delays_feature_store.get_entity_type("airport")
 airport_entity_type.ingest_from_gcs(
-    feature_ids=["average_departure_delay"],
+    feature_ids=[
+        "average_departure_delay",
+        "flight_count",
+        "p50_departure_delay",
+        "p90_departure_delay",
+        "average_taxi_out",
+        "cancellation_rate",
+    ],
     feature_time="timestamp",
     gcs_source_uris=f"gs://{BUCKET}/features/airport_features/*",
     gcs_source_type="avro",
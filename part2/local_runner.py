@@ -0,0 +1,129 @@
+"""Runs the part2 training pipeline locally, see `part1/local_runner.py`.
+
+By default the training data is joined locally from the feature pipeline
+outputs instead of the Feature Store:
+
+    python -m part2.local_runner \
+        --data-url=data/features/read_instances/manifest.txt \
+        --flight-features-url="data/features/flight_features/*" \
+        --airport-features-url="data/features/airport_features/*"
+"""
+
+import argparse
+from pathlib import Path
+
+from part1.local_runner import Step, StepOutput, add_runner_arguments, run_pipeline
+
+from .config import PROJECT_ID, REGION, FEATURE_STORE_ID
+
+TRAINING_PIPELINE = str(Path(__file__).parent / "training_pipeline.py")
+
+
+def training_steps(
+    data_url: str,
+    split_date: str,
+    flight_features_url: str,
+    airport_features_url: str,
+    dataset_format: str = "arrow",
+    serving_backend: str = "local",
+    cache_url: str = "",
+    feature_data_version: str = "",
+    training_mode: str = "batch",
+    training_workers: int = 4,
+):
+    """The steps of `training_pipeline.pipeline`."""
+    return [
+        Step(
+            "data_download",
+            "data_download",
+            {
+                "project": PROJECT_ID,
+                "location": REGION,
+                "feature_store": FEATURE_STORE_ID,
+                "data_url": data_url,
+                "split_date": split_date,
+                "dataset_format": dataset_format,
+                "serving_backend": serving_backend,
+                "flight_features_url": flight_features_url,
+                "airport_features_url": airport_features_url,
+                "cache_url": cache_url,
+                "feature_data_version": feature_data_version,
+            },
+        ),
+        Step(
+            "model_train",
+            "model_train",
+            {
+                "dataset": StepOutput("data_download", "dataset_train"),
+                "training_mode": training_mode,
+                "training_workers": training_workers,
+            },
+        ),
+        Step(
+            "model_evaluate",
+            "model_evaluate",
+            {
+                "test_set": StepOutput("data_download", "dataset_test"),
+                "model": StepOutput("model_train", "model"),
+            },
+        ),
+        # Deployment only happens on Vertex AI
+        Step("model_upload", None, {}, after=("model_evaluate",)),
+        Step("endpoint_create", None, {}),
+        Step("model_deploy", None, {}, after=("model_upload", "endpoint_create")),
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--data-url",
+        dest="data_url",
+        required=True,
+        help="Read instances: a manifest, a glob or a single file.",
+    )
+    parser.add_argument(
+        "--flight-features-url",
+        dest="flight_features_url",
+        default="",
+        help="Flight features written by the feature pipeline (Avro or Parquet).",
+    )
+    parser.add_argument(
+        "--airport-features-url",
+        dest="airport_features_url",
+        default="",
+        help="Airport features written by the feature pipeline (Avro or Parquet).",
+    )
+    parser.add_argument(
+        "--serving-backend",
+        dest="serving_backend",
+        choices=["local", "featurestore"],
+        default="local",
+        help="Join the features locally or with a Feature Store batch serve.",
+    )
+    parser.add_argument(
+        "--cache-url",
+        dest="cache_url",
+        default="",
+        help="Reuse training data snapshots stored here.",
+    )
+    add_runner_arguments(parser)
+    args = parser.parse_args()
+
+    run_pipeline(
+        training_steps(
+            args.data_url,
+            args.split_date,
+            args.flight_features_url,
+            args.airport_features_url,
+            args.dataset_format,
+            args.serving_backend,
+            args.cache_url,
+            training_mode=args.training_mode,
+            training_workers=args.training_workers,
+        ),
+        args.output_dir,
+        source_file=TRAINING_PIPELINE,
+        executor=args.executor,
+        max_workers=args.max_workers,
+    )
@@ -47,8 +47,31 @@ airport_entity_type = flight_delays_feature_store.create_entity_type(
     description="Airport entity",
 )
 
-airport_entity_type.create_feature(
-    feature_id="average_departure_delay",
-    value_type="DOUBLE",
-    description="Average departure delay for that airport, calculated every 4h with 1h rolling window",
+airport_entity_type.batch_create_features(
+    {
+        "average_departure_delay": {
+            "value_type": "DOUBLE",
+            "description": "Average departure delay for that airport, calculated every 4h with 1h rolling window",
+        },
+        "flight_count": {
+            "value_type": "INT64",
+            "description": "Number of departures from that airport in the 4h window",
+        },
+        "p50_departure_delay": {
+            "value_type": "DOUBLE",
+            "description": "Median departure delay in minutes in the 4h window",
+        },
+        "p90_departure_delay": {
+            "value_type": "DOUBLE",
+            "description": "90th percentile of the departure delay in minutes in the 4h window",
+        },
+        "average_taxi_out": {
+            "value_type": "DOUBLE",
+            "description": "Average taxi out time in minutes in the 4h window",
+        },
+        "cancellation_rate": {
+            "value_type": "DOUBLE",
+            "description": "Share of cancelled or diverted flights in the 4h window",
+        },
+    }
 )
@@ -31,6 +31,7 @@ pipeline_root_path = f"gs://{BUCKET}/pipeline-output/"
         "gcsfs",
         "google-cloud-bigquery-storage",
         "pyarrow",
+        "fastavro",
     ],
 )
 def data_download(
@@ -39,85 +40,828 @@ def data_download(
     feature_store: str,
     data_url: str,
     split_date: str,
+    dataset_format: str,
+    serving_backend: str,
+    flight_features_url: str,
+    airport_features_url: str,
+    cache_url: str,
+    feature_data_version: str,
     dataset_train: Output[Dataset],
     dataset_test: Output[Dataset],
 ):
+    import hashlib
+    import itertools
+    import json
+    import tempfile
+    import numpy as np
     import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import fsspec
     import logging
+    from concurrent.futures import ThreadPoolExecutor
+    from fsspec.core import url_to_fs
 
     from google.cloud import aiplatform as aip
 
     logging.warn("Import file:", data_url)
 
-    # Initialize Vertex AI client
-    aip.init(project=project, location=location)
+    serving_feature_ids = {
+        "flight": ["*"],
+        "airport": ["average_departure_delay"],
+    }
+    chunk_size = 1_000_000
+    # Hash partitions of the feature tables in the local backend
+    entity_partitions = 256
 
-    # Initiate feature store and run batch serve request
-    flight_delays_feature_store = aip.Featurestore(featurestore_name=feature_store)
+    # data_url is a manifest listing the read instance shards, a glob or a single file
+    if data_url.endswith(".txt"):
+        with fsspec.open(data_url, "r") as manifest:
+            shard_urls = [line.strip() for line in manifest if line.strip()]
+        shards = fsspec.open_files(shard_urls)
+    else:
+        shards = fsspec.open_files(data_url)
 
-    read_instances = pd.read_csv(data_url)
-    read_instances["flight"] = read_instances["flight"].astype(str)
-    read_instances["airport"] = read_instances["airport"].astype(str)
-    read_instances["timestamp"] = pd.to_datetime(read_instances["timestamp"])
+    def snapshot_key():
+        """Hash of everything the train and test datasets are derived from."""
+        sha256 = hashlib.sha256()
+        for shard in sorted(shards, key=lambda shard: shard.path):
+            with shard as file:
+                while chunk := file.read(16 * 1024 * 1024):
+                    sha256.update(chunk)
 
-    # Read features into a dataframe
-    data: pd.DataFrame = flight_delays_feature_store.batch_serve_to_df(
-        serving_feature_ids={
-            "flight": ["*"],
-            "airport": ["*"],
-        },
-        read_instances_df=read_instances,
-    )
+        parameters = {
+            "snapshot_format": 1,
+            "serving_feature_ids": serving_feature_ids,
+            "split_date": split_date,
+            "feature_data_version": feature_data_version,
+            "dataset_format": dataset_format,
+            "serving_backend": serving_backend,
+        }
+        if serving_backend == "local":
+            # Identity of every feature file (generation and checksum on GCS,
+            # modification time and size locally), so new features invalidate the key
+            parameters["feature_files"] = [
+                [feature_file.path, feature_file.fs.ukey(feature_file.path)]
+                for url in [flight_features_url, airport_features_url]
+                for feature_file in fsspec.open_files(url)
+            ]
+        sha256.update(json.dumps(parameters, sort_keys=True).encode("utf-8"))
+        return sha256.hexdigest()
 
-    completed_flights = data[~data["is_cancelled"]]
-
-    # Consider flights that arrive more than 15 min late as delayed
-    completed_flights["target"] = completed_flights["arrival_delay_minutes"] > 15
-    training_data = completed_flights.drop(
-        columns=[
-            "timestamp",
-            "entity_type_flight",
-            "is_cancelled",
-            "arrival_delay_minutes",
-            "origin_airport_id",
-            "entity_type_airport",
-        ]
-    )
+    # Reuse the datasets of an earlier run with the same inputs, if there is one
+    if cache_url:
+        cache_fs, cache_root = url_to_fs(cache_url)
+        snapshot_path = f"{cache_root}/{snapshot_key()}"
+        if cache_fs.exists(f"{snapshot_path}/_SUCCESS"):
+            logging.info("Reusing training data snapshot %s", snapshot_path)
+            cache_fs.get_file(f"{snapshot_path}/train", dataset_train.path)
+            cache_fs.get_file(f"{snapshot_path}/test", dataset_test.path)
+            return
+
+    def read_shard(shard):
+        with shard as file:
+            if shard.path.endswith(".parquet"):
+                return pd.read_parquet(file)
+            return pd.read_csv(file)
+
+    def read_shard_chunks(shard):
+        with shard as file:
+            if shard.path.endswith(".parquet"):
+                for batch in pq.ParquetFile(file).iter_batches(batch_size=chunk_size):
+                    yield batch.to_pandas()
+            else:
+                yield from pd.read_csv(file, chunksize=chunk_size)
+
+    def to_micros(timestamps):
+        naive_utc = pd.to_datetime(timestamps, utc=True).dt.tz_convert(None)
+        return naive_utc.to_numpy(dtype="datetime64[us]").view(np.int64)
+
+    class SpillFiles:
+        """Arrow files on local disk that collect rows by bucket, chunk by chunk."""
+
+        def __init__(self, directory, name):
+            self.path = f"{directory}/{name}"
+            self.schema = None
+            self.writers = {}
+            self.rows = {}
+
+        def write(self, table, buckets):
+            if self.schema is None:
+                self.schema = table.schema
+            elif table.schema != self.schema:
+                # E.g. timestamp units or all-null columns that differ between chunks
+                table = table.cast(self.schema)
+            order = np.argsort(buckets, kind="stable")
+            table = table.take(order)
+            values, starts, counts = np.unique(
+                buckets[order], return_index=True, return_counts=True
+            )
+            for bucket, start, count in zip(values.tolist(), starts, counts):
+                if bucket not in self.writers:
+                    self.writers[bucket] = pa.ipc.new_file(
+                        f"{self.path}-{bucket}.arrow", self.schema
+                    )
+                self.writers[bucket].write_table(table.slice(start, count))
+                self.rows[bucket] = self.rows.get(bucket, 0) + int(count)
+
+        def close(self):
+            for writer in self.writers.values():
+                writer.close()
+
+        def read(self, buckets):
+            """Reads the rows of `buckets` with nullable integer and boolean columns."""
+            tables = [
+                pa.ipc.open_file(f"{self.path}-{bucket}.arrow").read_all()
+                for bucket in buckets
+                if bucket in self.rows
+            ]
+            table = pa.concat_tables(tables) if tables else self.schema.empty_table()
+            return table.to_pandas(
+                types_mapper={
+                    pa.bool_(): pd.BooleanDtype(),
+                    pa.int64(): pd.Int64Dtype(),
+                }.get
+            )
+
+    def bucket_groups(*spills):
+        """Groups the buckets of the spills into runs of at most about chunk_size rows."""
+        group, rows = [], 0
+        for bucket in sorted(set().union(*(spill.rows for spill in spills))):
+            bucket_rows = sum(spill.rows.get(bucket, 0) for spill in spills)
+            if group and rows + bucket_rows > chunk_size:
+                yield group
+                group, rows = [], 0
+            group.append(bucket)
+            rows += bucket_rows
+        if group:
+            yield group
+
+    def entity_buckets(entity_ids):
+        """Hash partitions of the entity ids, the same for features and read instances."""
+        entity_ids = np.asarray(entity_ids).astype(str).astype(object)
+        return (pd.util.hash_array(entity_ids) % entity_partitions).astype(np.int64)
+
+    def avro_arrow_type(avro_type):
+        if isinstance(avro_type, list):
+            # Nullable union
+            (avro_type,) = [option for option in avro_type if option != "null"]
+        if isinstance(avro_type, dict):
+            if avro_type.get("logicalType") == "timestamp-micros":
+                return pa.timestamp("us", tz="UTC")
+            avro_type = avro_type["type"]
+        return {
+            "string": pa.string(),
+            "boolean": pa.bool_(),
+            "int": pa.int32(),
+            "long": pa.int64(),
+            "float": pa.float32(),
+            "double": pa.float64(),
+        }[avro_type]
+
+    def read_feature_chunks(url, entity_id_field, feature_ids):
+        """Reads the Avro or Parquet outputs of the feature pipeline as Arrow tables."""
+        import fastavro
+
+        columns = (
+            None
+            if feature_ids == ["*"]
+            else [entity_id_field, "timestamp", *feature_ids]
+        )
+        for feature_file in fsspec.open_files(url):
+            with feature_file as file:
+                if feature_file.path.endswith(".parquet"):
+                    yield from map(
+                        pa.Table.from_batches,
+                        (
+                            [batch]
+                            for batch in pq.ParquetFile(file).iter_batches(
+                                batch_size=chunk_size, columns=columns
+                            )
+                        ),
+                    )
+                else:
+                    reader = fastavro.reader(file)
+                    schema = pa.schema(
+                        (field["name"], avro_arrow_type(field["type"]))
+                        for field in reader.writer_schema["fields"]
+                        if columns is None or field["name"] in columns
+                    )
+                    while records := list(itertools.islice(reader, chunk_size)):
+                        yield pa.Table.from_pylist(records, schema=schema)
+
+    def spill_features(directory, url, entity_id_field, feature_ids):
+        """Partitions the feature table by entity, so it never has to fit in memory."""
+        spill = SpillFiles(directory, entity_id_field)
+        for table in read_feature_chunks(url, entity_id_field, feature_ids):
+            spill.write(table, entity_buckets(table[entity_id_field]))
+        spill.close()
+        if spill.schema is None:
+            raise ValueError(f"No features found at {url}")
+        return spill
+
+    def index_features(features, entity_id_field):
+        """Sorts the features of some entities for `as_of_join`.
+
+        The rows are sorted by a key that combines the entity and the rank of
+        the feature timestamp, so an as-of lookup is a single binary search.
+        """
+        entity_codes, entity_ids = pd.factorize(features.pop(entity_id_field))
+        unique_timestamps, timestamp_ranks = np.unique(
+            to_micros(features.pop("timestamp")), return_inverse=True
+        )
+        keys = entity_codes.astype(np.int64) * len(unique_timestamps) + timestamp_ranks
+        order = np.argsort(keys, kind="stable")
+        values = features.iloc[order].reset_index(drop=True)
+        return pd.Index(entity_ids), unique_timestamps, keys[order], values
+
+    def as_of_join(features, entity_ids, timestamps):
+        """Returns the latest feature values at or before each timestamp."""
+        feature_entity_ids, unique_timestamps, keys, values = features
 
-    test_data = training_data[completed_flights["timestamp"] >= split_date]
-    training_data = training_data[completed_flights["timestamp"] < split_date]
+        codes = feature_entity_ids.get_indexer(entity_ids)
+        ranks = np.searchsorted(unique_timestamps, timestamps, side="right") - 1
+        lookup_keys = codes.astype(np.int64) * len(unique_timestamps) + ranks
+        positions = np.searchsorted(keys, lookup_keys, side="right") - 1
 
-    training_data.to_csv(dataset_train.path, index=False)
-    test_data.to_csv(dataset_test.path, index=False)
+        found = (codes >= 0) & (ranks >= 0) & (positions >= 0)
+        found[found] = keys[positions[found]] // len(unique_timestamps) == codes[found]
+
+        # Read instances without a match get missing values
+        return values.reindex(np.where(found, positions, -1)).reset_index(drop=True)
+
+    def join_features(directory, instances, features, entity_id_field, column, output):
+        """Joins the spilled read instances with the features of the same entities.
+
+        Each group of buckets holds all feature rows of its entities, so only
+        about chunk_size rows of each side are in memory at a time. The joined
+        rows are spilled to `output`, bucketed by `column`.
+        """
+        joined_spill = SpillFiles(directory, output)
+        for buckets in bucket_groups(instances, features):
+            read_instances = instances.read(buckets)
+            joined = pd.concat(
+                [
+                    read_instances,
+                    as_of_join(
+                        index_features(features.read(buckets), entity_id_field),
+                        read_instances[column].to_numpy(),
+                        to_micros(read_instances["timestamp"]),
+                    ),
+                ],
+                axis=1,
+            )
+            table = pa.Table.from_pandas(joined, preserve_index=False)
+            if output == "joined":
+                # Ranges of chunk_size read instances, to restore their order
+                output_buckets = (
+                    read_instances["row"].to_numpy(dtype=np.int64) // chunk_size
+                )
+            else:
+                output_buckets = entity_buckets(read_instances["airport"])
+            joined_spill.write(table, output_buckets)
+        joined_spill.close()
+        return joined_spill
+
+    def serve_local():
+        """Joins the read instances with the feature pipeline outputs, chunk by chunk.
+
+        Both sides are partitioned by entity into spill files on local disk
+        first, the flight features by flight and the airport features by
+        airport. The partitions are joined one group at a time and the joined
+        rows are put back into the order of the read instances, so memory is
+        bounded by chunk_size instead of by the size of the feature tables.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            instances = SpillFiles(directory, "read_instances")
+            row = 0
+            for shard in shards:
+                for read_instances in read_shard_chunks(shard):
+                    flights = read_instances["flight"].astype(str).to_numpy()
+                    table = pa.table(
+                        {
+                            "row": np.arange(row, row + len(flights)),
+                            "timestamp": pd.to_datetime(
+                                read_instances["timestamp"], utc=True
+                            ),
+                            "flight": flights,
+                            "airport": read_instances["airport"].astype(str).to_numpy(),
+                        }
+                    )
+                    instances.write(table, entity_buckets(flights))
+                    row += len(flights)
+            instances.close()
+
+            flight_features = spill_features(
+                directory,
+                flight_features_url,
+                "flight_number",
+                serving_feature_ids["flight"],
+            )
+            flights_joined = join_features(
+                directory,
+                instances,
+                flight_features,
+                "flight_number",
+                "flight",
+                "flights_joined",
+            )
+            airport_features = spill_features(
+                directory,
+                airport_features_url,
+                "origin_airport_id",
+                serving_feature_ids["airport"],
+            )
+            joined = join_features(
+                directory,
+                flights_joined,
+                airport_features,
+                "origin_airport_id",
+                "airport",
+                "joined",
+            )
+
+            flight_columns = [
+                name
+                for name in flights_joined.schema.names
+                if name not in ("row", "timestamp", "flight", "airport")
+            ]
+            airport_columns = [
+                name
+                for name in joined.schema.names
+                if name not in flights_joined.schema.names
+            ]
+            for bucket in sorted(joined.rows):
+                data = joined.read([bucket]).sort_values("row", ignore_index=True)
+
+                # Same columns as Featurestore.batch_serve_to_df
+                yield pd.concat(
+                    [
+                        pd.DataFrame(
+                            {
+                                "timestamp": data["timestamp"].array,
+                                "entity_type_flight": data["flight"].to_numpy(),
+                            }
+                        ),
+                        data[flight_columns],
+                        pd.DataFrame(
+                            {"entity_type_airport": data["airport"].to_numpy()}
+                        ),
+                        data[airport_columns],
+                    ],
+                    axis=1,
+                )
+
+    def serve_feature_store():
+        # Initialize Vertex AI client
+        aip.init(project=project, location=location)
+
+        # Initiate feature store and run batch serve request
+        flight_delays_feature_store = aip.Featurestore(featurestore_name=feature_store)
+
+        with ThreadPoolExecutor(max_workers=min(32, len(shards) or 1)) as executor:
+            read_instances = pd.concat(
+                executor.map(read_shard, shards), ignore_index=True
+            )
+        read_instances["flight"] = read_instances["flight"].astype(str)
+        read_instances["airport"] = read_instances["airport"].astype(str)
+        read_instances["timestamp"] = pd.to_datetime(read_instances["timestamp"])
+
+        # Read features into a dataframe
+        yield flight_delays_feature_store.batch_serve_to_df(
+            serving_feature_ids=serving_feature_ids,
+            read_instances_df=read_instances,
+        )
+
+    # Arrow IPC files (memory-mappable, typed) or CSV files, appended chunk by chunk
+    writers = {}
+
+    def write(path, df):
+        if dataset_format == "arrow":
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if path not in writers:
+                writers[path] = pa.ipc.new_file(path, table.schema)
+            writers[path].write_table(table)
+        else:
+            df.to_csv(
+                path,
+                mode="a" if path in writers else "w",
+                header=path not in writers,
+                index=False,
+            )
+            writers[path] = None
+
+    for data in serve_local() if serving_backend == "local" else serve_feature_store():
+        # Read instances without flight features are skipped
+        completed_flights = data[~data["is_cancelled"].fillna(True).astype(bool)]
+
+        # Consider flights that arrive more than 15 min late as delayed
+        training_data = completed_flights[
+            # Same feature order as the instances that predict.py sends to the endpoint
+            [
+                "distance_miles",
+                "departure_delay_minutes",
+                "taxi_out_minutes",
+                "average_departure_delay",
+            ]
+        ].assign(target=completed_flights["arrival_delay_minutes"] > 15)
+
+        is_test = (completed_flights["timestamp"] >= split_date).to_numpy()
+        write(dataset_train.path, training_data[~is_test])
+        write(dataset_test.path, training_data[is_test])
+
+    for writer in writers.values():
+        if writer is not None:
+            writer.close()
+
+    if cache_url:
+        cache_fs.makedirs(snapshot_path, exist_ok=True)
+        cache_fs.put_file(dataset_train.path, f"{snapshot_path}/train")
+        cache_fs.put_file(dataset_test.path, f"{snapshot_path}/test")
+        # Written last, so that incomplete snapshots are never reused
+        cache_fs.pipe_file(f"{snapshot_path}/_SUCCESS", b"")
 
 
 @component(
     base_image="europe-docker.pkg.dev/vertex-ai/prediction/sklearn-cpu.1-0:latest",
+    packages_to_install=["pyarrow"],
 )
 def model_train(
     dataset: Input[Dataset],
     model: Output[Artifact],
+    training_mode: str = "batch",
+    training_workers: int = 4,
 ):
+    import numpy as np
     import pandas as pd
     import pickle
+    import pyarrow as pa
+    import sklearn
     from sklearn.pipeline import Pipeline
     from sklearn.impute import SimpleImputer
     from sklearn.preprocessing import StandardScaler
-    from sklearn.linear_model import LogisticRegression
-
-    data = pd.read_csv(dataset.path)
-    X = data.drop(columns=["target"])
-    y = data["target"]
-
-    model_pipeline = Pipeline(
-        [
-            ("imputer", SimpleImputer(strategy="median")),
-            ("scaler", StandardScaler()),
-            ("clf", LogisticRegression(random_state=42)),
-        ]
-    )
+    from sklearn.linear_model import LogisticRegression, SGDClassifier
 
-    model_pipeline.fit(X, y)
+    with open(dataset.path, "rb") as file:
+        is_arrow = file.read(6) == b"ARROW1"
+
+    if training_mode in ("batch", "search"):
+        if is_arrow:
+            # Arrow IPC file written by data_download: map it instead of parsing it
+            data = pa.ipc.open_file(pa.memory_map(dataset.path)).read_pandas()
+        else:
+            data = pd.read_csv(dataset.path)
+        X = data.drop(columns=["target"])
+        y = data["target"]
+
+        model_pipeline = Pipeline(
+            [
+                ("imputer", SimpleImputer(strategy="median")),
+                ("scaler", StandardScaler()),
+                ("clf", LogisticRegression(random_state=42)),
+            ]
+        )
+
+        if training_mode == "search":
+            from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+            from sklearn.model_selection import HalvingGridSearchCV
+            from sklearn.preprocessing import RobustScaler
+
+            # Every round fits the remaining candidates on all cores, each round
+            # on 3 times more rows, and only the best third of them continues
+            search = HalvingGridSearchCV(
+                model_pipeline,
+                {
+                    "imputer__strategy": ["median", "mean"],
+                    "scaler": [StandardScaler(), RobustScaler()],
+                    "clf__C": [0.01, 0.1, 1.0, 10.0],
+                    "clf__class_weight": [None, "balanced"],
+                },
+                factor=3,
+                scoring="roc_auc",
+                n_jobs=-1,
+                random_state=42,
+            )
+            search.fit(X, y)
+            model_pipeline = search.best_estimator_
+
+            def to_json(params):
+                return {
+                    name: (
+                        value
+                        if value is None or isinstance(value, (str, int, float))
+                        else repr(value)
+                    )
+                    for name, value in params.items()
+                }
+
+            results = search.cv_results_
+            model.metadata["search"] = {
+                "bestParams": to_json(search.best_params_),
+                "bestScore": float(search.best_score_),
+                "candidates": [
+                    {
+                        "iteration": int(results["iter"][i]),
+                        "samples": int(results["n_resources"][i]),
+                        "params": to_json(results["params"][i]),
+                        "meanTestScore": float(results["mean_test_score"][i]),
+                        "meanFitSeconds": float(results["mean_fit_time"][i]),
+                    }
+                    for i in range(len(results["params"]))
+                ],
+            }
+        else:
+            model_pipeline.fit(X, y)
+    elif training_mode == "streaming":
+        # Out-of-core: only one chunk of the training data is in memory at a time
+        chunk_size = 500_000
+        sample_size = 100_000
+        epochs = 5
+        rng = np.random.default_rng(42)
+
+        def read_chunks():
+            if is_arrow:
+                reader = pa.ipc.open_file(pa.memory_map(dataset.path))
+                for i in range(reader.num_record_batches):
+                    batch = reader.get_batch(i)
+                    for offset in range(0, batch.num_rows, chunk_size):
+                        yield batch.slice(offset, chunk_size).to_pandas()
+            else:
+                yield from pd.read_csv(dataset.path, chunksize=chunk_size)
+
+        # 1st pass: the imputer medians are estimated on a reservoir sample of rows
+        sample, seen = None, 0
+        for chunk in read_chunks():
+            X = chunk.drop(columns=["target"])
+            if sample is None:
+                columns = X.columns
+                sample = np.empty((sample_size, len(columns)))
+            values = X.to_numpy(dtype=np.float64)
+            filled = min(seen, sample_size)
+            fill = min(sample_size - filled, len(values))
+            sample[filled : filled + fill] = values[:fill]
+            # Row i replaces a random sample row with probability sample_size / (i + 1)
+            positions = rng.integers(0, seen + np.arange(fill, len(values)) + 1)
+            replace = positions < sample_size
+            sample[positions[replace]] = values[fill:][replace]
+            seen += len(values)
+        if sample is None:
+            raise ValueError(f"No training data in {dataset.path}")
+        imputer = SimpleImputer(strategy="median").fit(
+            pd.DataFrame(sample[: min(seen, sample_size)], columns=columns)
+        )
+
+        # 2nd pass: the scaler statistics are merged over all chunks
+        scaler = StandardScaler()
+        for chunk in read_chunks():
+            scaler.partial_fit(imputer.transform(chunk.drop(columns=["target"])))
+
+        # Then the classifier sees every chunk once per epoch, with shuffled rows
+        # as data_download writes the flights ordered by date
+        sklearn_version = tuple(int(v) for v in sklearn.__version__.split(".")[:2])
+        clf = SGDClassifier(
+            loss="log_loss" if sklearn_version >= (1, 1) else "log",
+            random_state=42,
+        )
+        for _ in range(epochs):
+            for chunk in read_chunks():
+                order = rng.permutation(len(chunk))
+                X = scaler.transform(imputer.transform(chunk.drop(columns=["target"])))
+                y = chunk["target"].to_numpy(dtype=bool)
+                clf.partial_fit(X[order], y[order], classes=[False, True])
+
+        # Same steps as in batch mode, so the model is used in the same way
+        model_pipeline = Pipeline(
+            [("imputer", imputer), ("scaler", scaler), ("clf", clf)]
+        )
+    elif training_mode == "distributed":
+        # Data-parallel: every worker process loads one shard of the rows and
+        # only sends statistics and gradients. The same protocol would work
+        # with one replica per shard.
+        import io
+        import multiprocessing
+        import os
+        import traceback
+        from scipy.optimize import minimize
+
+        def read_shard(index):
+            if is_arrow:
+                table = pa.ipc.open_file(pa.memory_map(dataset.path)).read_all()
+                start = table.num_rows * index // training_workers
+                end = table.num_rows * (index + 1) // training_workers
+                return table.slice(start, end - start).to_pandas()
+
+            # CSV: a shard holds the lines starting in its byte range
+            with open(dataset.path, "rb") as file:
+                header = file.readline()
+                size = os.path.getsize(dataset.path) - len(header)
+
+                def line_start(offset):
+                    if offset == 0:
+                        return len(header)
+                    file.seek(len(header) + offset - 1)
+                    file.readline()
+                    return file.tell()
+
+                start = line_start(size * index // training_workers)
+                end = line_start(size * (index + 1) // training_workers)
+                file.seek(start)
+                return pd.read_csv(io.BytesIO(header + file.read(end - start)))
+
+        def run_shard(connection, index):
+            data = read_shard(index)
+            X = data.drop(columns=["target"]).to_numpy(dtype=np.float64)
+            # Labels as -1 / 1
+            y = np.where(data["target"].to_numpy(dtype=bool), 1.0, -1.0)
+            del data
+
+            # Value counts can be merged into the exact medians
+            connection.send(
+                (
+                    "ok",
+                    [
+                        np.unique(column[~np.isnan(column)], return_counts=True)
+                        for column in X.T
+                    ],
+                )
+            )
+            X = np.where(np.isnan(X), connection.recv(), X)
+            # A CSV byte range can hold no line start, an empty shard adds nothing
+            mean = X.mean(axis=0) if len(X) else np.zeros(X.shape[1])
+            connection.send(("ok", (len(X), mean, ((X - mean) ** 2).sum(axis=0))))
+            mean, scale = connection.recv()
+            X = (X - mean) / scale
+
+            # Log loss and its gradient for the coefficients and intercept
+            while (params := connection.recv()) is not None:
+                margin = y * (X @ params[:-1] + params[-1])
+                gradient = -y / (1 + np.exp(margin))
+                connection.send(
+                    (
+                        "ok",
+                        (
+                            np.logaddexp(0, -margin).sum(),
+                            np.append(X.T @ gradient, gradient.sum()),
+                        ),
+                    )
+                )
+
+        def worker(connection, index):
+            # The forked worker inherits the parent's ends of the pipes, which
+            # would keep it from seeing the parent close them
+            for parent_connection in connections:
+                parent_connection.close()
+            try:
+                run_shard(connection, index)
+            except (EOFError, BrokenPipeError):
+                # The parent closed the connection after another worker failed
+                pass
+            except Exception:
+                connection.send(("error", traceback.format_exc()))
+
+        if is_arrow:
+            reader = pa.ipc.open_file(pa.memory_map(dataset.path))
+            names = reader.schema.names
+            num_rows = sum(
+                reader.get_batch(i).num_rows for i in range(reader.num_record_batches)
+            )
+        else:
+            names = pd.read_csv(dataset.path, nrows=0).columns
+            with open(dataset.path, "rb") as file:
+                num_rows = -1  # header row
+                while chunk := file.read(16 * 1024 * 1024):
+                    num_rows += chunk.count(b"\n")
+        columns = [name for name in names if name != "target"]
+        if num_rows <= 0:
+            raise ValueError(f"The training dataset {dataset.path} has no rows")
+        # More workers than rows would only add empty shards
+        training_workers = min(training_workers, num_rows)
+
+        context = multiprocessing.get_context("fork")
+        connections, processes = [], []
+        for index in range(training_workers):
+            connection, worker_connection = context.Pipe()
+            connections.append(connection)
+            process = context.Process(target=worker, args=(worker_connection, index))
+            process.start()
+            # Only the worker holds this end, so its exit shows up as EOFError
+            worker_connection.close()
+            processes.append(process)
+
+        def receive_all():
+            results = []
+            for index, connection in enumerate(connections):
+                try:
+                    status, result = connection.recv()
+                except EOFError:
+                    processes[index].join()
+                    raise RuntimeError(
+                        f"Training worker {index} exited with code "
+                        f"{processes[index].exitcode}"
+                    )
+                if status == "error":
+                    raise RuntimeError(f"Training worker {index} failed:\n{result}")
+                results.append(result)
+            return results
+
+        try:
+            value_counts = receive_all()
+            medians = []
+            for column_counts in zip(*value_counts):
+                values, counts = np.unique(
+                    np.concatenate([values for values, _ in column_counts]),
+                    return_inverse=True,
+                )
+                counts = np.bincount(
+                    counts,
+                    weights=np.concatenate([counts for _, counts in column_counts]),
+                )
+                # Same as np.median: the middle value, or the mean of the middle two
+                total = counts.sum()
+                positions = np.searchsorted(
+                    np.cumsum(counts), [(total - 1) // 2, total // 2], side="right"
+                )
+                medians.append(values[positions].mean())
+            medians = np.array(medians)
+            for connection in connections:
+                connection.send(medians)
+
+            # Means and variances of the shards are merged (Chan et al.)
+            stats = [shard_stats for shard_stats in receive_all() if shard_stats[0]]
+            num_samples = sum(n for n, _, _ in stats)
+            mean = sum(n * shard_mean for n, shard_mean, _ in stats) / num_samples
+            var = (
+                sum(
+                    squares + n * (shard_mean - mean) ** 2
+                    for n, shard_mean, squares in stats
+                )
+                / num_samples
+            )
+            if not (np.isfinite(mean).all() and np.isfinite(var).all()):
+                raise ValueError(
+                    f"The merged scaler statistics are not finite: mean {mean}, "
+                    f"variance {var}"
+                )
+            scale = np.where(var == 0, 1.0, np.sqrt(var))
+            for connection in connections:
+                connection.send((mean, scale))
+
+            # Same objective and L-BFGS settings as LogisticRegression(C=1.0)
+            def loss_and_gradient(params):
+                for connection in connections:
+                    connection.send(params)
+                results = receive_all()
+                loss = (
+                    sum(loss for loss, _ in results) + 0.5 * params[:-1] @ params[:-1]
+                )
+                gradient = sum(gradient for _, gradient in results)
+                gradient[:-1] += params[:-1]
+                return loss, gradient
+
+            result = minimize(
+                loss_and_gradient,
+                np.zeros(len(medians) + 1),
+                method="L-BFGS-B",
+                jac=True,
+                options={
+                    "maxiter": 100,
+                    "maxls": 50,
+                    "gtol": 1e-4,
+                    "ftol": 64 * np.finfo(float).eps,
+                },
+            )
+            for connection in connections:
+                connection.send(None)
+        finally:
+            # Workers waiting for a message stop when their connection is closed
+            for connection in connections:
+                connection.close()
+            for process in processes:
+                process.join(timeout=10)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+
+        # The steps are fitted on placeholder rows to be valid sklearn objects,
+        # then get the merged statistics and the optimized coefficients
+        imputer = SimpleImputer(strategy="median").fit(
+            pd.DataFrame([medians], columns=columns)
+        )
+        scaler = StandardScaler().fit(np.stack([mean - scale, mean + scale]))
+        scaler.mean_, scaler.var_, scaler.scale_ = mean, var, scale
+        scaler.n_samples_seen_ = num_samples
+        clf = LogisticRegression(random_state=42).fit(
+            np.zeros((2, len(columns))), [False, True]
+        )
+        clf.coef_ = result.x[np.newaxis, :-1]
+        clf.intercept_ = result.x[-1:]
+        clf.n_iter_ = np.array([result.nit])
+
+        model_pipeline = Pipeline(
+            [("imputer", imputer), ("scaler", scaler), ("clf", clf)]
+        )
+    else:
+        raise ValueError(f"Unknown training mode {training_mode}")
 
     model.metadata["framework"] = "scikit-learn"
     model.metadata["containerSpec"] = {
@@ -131,43 +875,133 @@ def model_train(
     with open(file_name, "wb") as file:
         pickle.dump(model_pipeline, file)
 
+    # Compact scoring artifact for fused_scorer.py: the scaler is folded into
+    # the weights and bias of the classifier, only the fill values remain
+    imputer, scaler, clf = (step for _, step in model_pipeline.steps)
+    if isinstance(scaler, StandardScaler):
+        offset = scaler.mean_ if scaler.with_mean else None
+    else:
+        offset = scaler.center_
+    num_features = len(imputer.statistics_)
+    offset = np.zeros(num_features) if offset is None else offset
+    scale = np.ones(num_features) if scaler.scale_ is None else scaler.scale_
+    weights = clf.coef_[0] / scale
+    np.savez(
+        model.path + "/model.npz",
+        fill_values=imputer.statistics_,
+        weights=weights,
+        bias=clf.intercept_[0] - weights @ offset,
+        classes=clf.classes_,
+    )
+
 
 @component(
     base_image="europe-docker.pkg.dev/vertex-ai/prediction/sklearn-cpu.1-0:latest",
+    packages_to_install=["pyarrow"],
 )
 def model_evaluate(
     test_set: Input[Dataset],
     model: Input[Model],
     metrics: Output[ClassificationMetrics],
 ):
+    import os
+    import numpy as np
     import pandas as pd
     import pickle
-    from sklearn.metrics import roc_curve, confusion_matrix, accuracy_score
+    import pyarrow as pa
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+    from sklearn.metrics import confusion_matrix
+
+    # The whole test set is scored in chunks, only their counts are kept
+    chunk_size = 100_000
+    num_bins = 1000
+    bins = np.linspace(0, 1, num_bins + 1)
+    workers = os.cpu_count() or 1
+
+    with open(test_set.path, "rb") as file:
+        is_arrow = file.read(6) == b"ARROW1"
+
+    def read_chunks():
+        if is_arrow:
+            # Arrow IPC file written by data_download: map it instead of parsing it
+            reader = pa.ipc.open_file(pa.memory_map(test_set.path))
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                for offset in range(0, batch.num_rows, chunk_size):
+                    yield batch.slice(offset, chunk_size).to_pandas()
+        else:
+            yield from pd.read_csv(test_set.path, chunksize=chunk_size)
 
-    data = pd.read_csv(test_set.path)[:1000]
     file_name = model.path + "/model.pkl"
     with open(file_name, "rb") as file:
         model_pipeline = pickle.load(file)
 
-    X = data.drop(columns=["target"])
-    y = data.target
-    y_pred = model_pipeline.predict(X)
+    def evaluate_chunk(data):
+        X = data.drop(columns=["target"])
+        y = data["target"].to_numpy(dtype=bool)
+        y_scores = model_pipeline.predict_proba(X)[:, 1]
+        # Same as predict: the positive class is more likely
+        y_pred = y_scores > 0.5
+        return (
+            confusion_matrix(y, y_pred, labels=[False, True]),
+            np.histogram(y_scores[y], bins)[0],
+            np.histogram(y_scores[~y], bins)[0],
+        )
+
+    matrix = np.zeros((2, 2), dtype=np.int64)
+    positives = np.zeros(num_bins, dtype=np.int64)
+    negatives = np.zeros(num_bins, dtype=np.int64)
+
+    def merge(futures):
+        for future in futures:
+            chunk_matrix, chunk_positives, chunk_negatives = future.result()
+            matrix[:] += chunk_matrix
+            positives[:] += chunk_positives
+            negatives[:] += chunk_negatives
 
-    y_scores = model_pipeline.predict_proba(X)[:, 1]
-    fpr, tpr, thresholds = roc_curve(y_true=y, y_score=y_scores, pos_label=True)
-    metrics.log_roc_curve(fpr.tolist(), tpr.tolist(), thresholds.tolist())
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        running = set()
+        for chunk in read_chunks():
+            # Bounds the number of chunks in memory
+            if len(running) >= 2 * workers:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                merge(done)
+            running.add(pool.submit(evaluate_chunk, chunk))
+        merge(wait(running)[0])
+
+    # ROC over the bin edges: scores in the bins at or above a threshold are
+    # positive. Empty bins don't change the curve and are left out
+    true_positives = np.concatenate([[0], np.cumsum(positives[::-1])])
+    false_positives = np.concatenate([[0], np.cumsum(negatives[::-1])])
+    thresholds = bins[::-1]
+    keep = np.concatenate([[True], (positives + negatives)[::-1] > 0])
+    tpr = true_positives[keep] / max(true_positives[-1], 1)
+    fpr = false_positives[keep] / max(false_positives[-1], 1)
+    metrics.log_roc_curve(fpr.tolist(), tpr.tolist(), thresholds[keep].tolist())
 
     metrics.log_confusion_matrix(
         ["False", "True"],
-        confusion_matrix(y, y_pred).tolist(),
+        matrix.tolist(),
     )
 
 
 # Define the workflow of the pipeline.
 @pipeline(name="gcp-mlops-v0", pipeline_root=pipeline_root_path)
 def pipeline(
-    training_data_url: str = f"gs://{BUCKET}/features/read_instances/-00000-of-00001.csv",
+    training_data_url: str = f"gs://{BUCKET}/features/read_instances/manifest.txt",
     test_split_date: str = "2021-12-20",
+    dataset_format: str = "arrow",
+    serving_backend: str = "featurestore",
+    flight_features_url: str = f"gs://{BUCKET}/features/flight_features/*",
+    airport_features_url: str = f"gs://{BUCKET}/features/airport_features/*",
+    # Set cache_url (e.g. gs://BUCKET/training_snapshots) to reuse training data
+    # snapshots while the inputs are unchanged. The local serving backend detects
+    # new feature files, with the feature store the feature data version has to
+    # be changed after every ingestion
+    cache_url: str = "",
+    feature_data_version: str = "",
+    training_mode: str = "batch",
+    training_workers: int = 4,
 ):
     data_op = data_download(
         project=PROJECT_ID,
@@ -175,6 +1009,12 @@ def pipeline(
         feature_store=FEATURE_STORE_ID,
         data_url=training_data_url,
         split_date=test_split_date,
+        dataset_format=dataset_format,
+        serving_backend=serving_backend,
+        flight_features_url=flight_features_url,
+        airport_features_url=airport_features_url,
+        cache_url=cache_url,
+        feature_data_version=feature_data_version,
     )
 
     from google_cloud_pipeline_components.experimental.custom_job.utils import (
@@ -187,6 +1027,8 @@ def pipeline(
 
     model_train_op = custom_job_distributed_training_op(
         dataset=data_op.outputs["dataset_train"],
+        training_mode=training_mode,
+        training_workers=training_workers,
         project=PROJECT_ID,
         location=REGION,
     )
@@ -219,14 +1061,17 @@ def pipeline(
     )
 
 
-compiler.Compiler().compile(pipeline_func=pipeline, package_path="gcp-mlops-v0.json")
+if __name__ == "__main__":
+    compiler.Compiler().compile(
+        pipeline_func=pipeline, package_path="gcp-mlops-v0.json"
+    )
 
-aip.init(project=PROJECT_ID, staging_bucket=BUCKET, location=REGION)
+    aip.init(project=PROJECT_ID, staging_bucket=BUCKET, location=REGION)
 
-job = aip.PipelineJob(
-    display_name="gcp-mlops-v0",
-    template_path="gcp-mlops-v0.json",
-    pipeline_root=pipeline_root_path,
-)
+    job = aip.PipelineJob(
+        display_name="gcp-mlops-v0",
+        template_path="gcp-mlops-v0.json",
+        pipeline_root=pipeline_root_path,
+    )
 
-job.run(service_account=SERVICE_ACCOUNT)
+    job.run(service_account=SERVICE_ACCOUNT)